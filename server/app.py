@@ -1,8 +1,14 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 from config import Config
-from routes.auth import auth_bp
+from routes.auth import auth_bp, principal_cache
 from routes.chat import chat_bp
+from routes.health import health_bp
+from services.chat_turn import messages_collection, context_cache, summarizer
+from utils.chat_store import ensure_indexes
+from utils.encryption import decrypt_cache
+from utils.response_cache import response_cache
+from utils.metrics import registry, begin_request, end_request
 import os
 
 def create_app():
@@ -17,6 +23,12 @@ def create_app():
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
+    app.register_blueprint(health_bp)
+    
+    # Make sure the chat message buckets are indexed for recent-first reads
+    ensure_indexes(messages_collection)
+    
+    register_metrics(app)
     
     @app.route('/')
     def index():
@@ -24,7 +36,30 @@ def create_app():
     
     return app
 
+def register_metrics(app):
+    """Time every request by route and serve the process's metrics at /metrics"""
+    registry.caches.register('principal', principal_cache)
+    registry.caches.register('decrypt', decrypt_cache)
+    registry.caches.register('context', context_cache)
+    registry.caches.register('summary', summarizer.cache)
+    registry.caches.register('response', response_cache)
+    
+    @app.before_request
+    def start_request_timer():
+        # Label by URL rule so ids in paths can't blow up the label set
+        begin_request(request.url_rule.rule if request.url_rule else 'unmatched')
+    
+    @app.after_request
+    def record_request_time(response):
+        end_request(request.method, response.status_code)
+        return response
+    
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # Development server only; production runs `gunicorn -c gunicorn.conf.py` (see wsgi.py)
     app = create_app()
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Async serving mode
+
+The chat routes that wait on Gemini (/api/chat/send and /api/chat/voice) run
+as async Quart handlers on motor and httpx, so one worker process can hold
+many chats in flight. Every other route is served by the regular Flask app
+from create_app through a WSGI adapter, on a pool of GUNICORN_THREADS threads.
+
+Run with:
+    uvicorn asgi:create_asgi_app --factory --host 0.0.0.0 --port 5000
+"""
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from quart import Quart, request
+from config import Config
+from app import create_app
+from utils.metrics import begin_request, end_request
+from routes.async_chat import async_chat_bp, close_clients
+
+# Paths handled natively by the async app; everything else goes to Flask
+ASYNC_PATHS = {'/api/chat/send', '/api/chat/voice'}
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi that runs each request on its own thread from a pool
+    
+    asgiref's adapter runs WSGI calls thread-sensitively, i.e. all of them on
+    one thread per process, so a streamed chat turn held every other Flask
+    route (history, login, health probes) in a queue behind it.
+    """
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+    
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiToAsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """
+    Runs the WSGI app with our own runner on the adapter's pool
+
+    Only run_wsgi_app is replaced; request parsing (build_environ,
+    start_response, sync_send) is asgiref's.
+    """
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+    
+    async def run_wsgi_app(self, body):
+        await sync_to_async(self.run_wsgi, thread_sensitive=False, executor=self.executor)(body)
+    
+    def run_wsgi(self, body):
+        """Call the WSGI app on a pool thread and send its response as ASGI messages"""
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            # Newer asgiref rejects requests with too many duplicate headers here
+            self.sync_send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request'})
+            return
+        output = self.wsgi_application(environ, self.start_response)
+        try:
+            for chunk in output:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if chunk:
+                    self.sync_send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            # WSGI requires close(); Flask runs its streamed-response teardown there
+            if hasattr(output, 'close'):
+                output.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+def create_async_app():
+    app = Quart(__name__)
+    app.config.from_object(Config)
+    app.register_blueprint(async_chat_bp, url_prefix='/api/chat')
+    
+    @app.before_request
+    async def start_request_timer():
+        # Must be async: Quart runs sync hooks in a thread, where the route label would be lost
+        begin_request(request.url_rule.rule if request.url_rule else 'unmatched')
+    
+    @app.after_request
+    async def allow_any_origin(response):
+        # Mirrors the Flask app's CORS setup; preflights are answered by Flask
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        end_request(request.method, response.status_code)
+        return response
+    
+    @app.after_serving
+    async def shutdown():
+        await close_clients()
+    
+    return app
+
+def create_asgi_app():
+    async_app = create_async_app()
+    wsgi_app = PooledWsgiToAsgi(create_app(), Config.GUNICORN_THREADS)
+    
+    async def asgi_app(scope, receive, send):
+        # The WSGI adapter has no lifespan support; the Quart app owns startup/shutdown
+        if scope['type'] == 'lifespan' or (
+            scope.get('path') in ASYNC_PATHS and scope.get('method') != 'OPTIONS'
+        ):
+            await async_app(scope, receive, send)
+        else:
+            await wsgi_app(scope, receive, send)
+    
+    return asgi_app
@@ -0,0 +1,68 @@
+"""
+Benchmark: per-request cost of token_required with and without the principal cache
+
+Runs against mongomock by default, or a real server with --mongo-uri
+(e.g. a local mongod) to include the network round-trip.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_auth [--requests 2000] [--mongo-uri mongodb://localhost:27017]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JWT verification with and without the principal cache')
+    parser.add_argument('--requests', type=int, default=2000, help='Authenticated requests per run')
+    parser.add_argument('--mongo-uri', help='Use a real MongoDB instead of mongomock')
+    args = parser.parse_args()
+
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret-key-of-reasonable-length')
+    if args.mongo_uri:
+        os.environ['MONGO_URI'] = args.mongo_uri
+    else:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import jwt
+    from flask import Flask, jsonify
+    from routes import auth
+
+    app = Flask(__name__)
+
+    @app.route('/whoami')
+    @auth.token_required
+    def whoami(current_user):
+        return jsonify({'user_id': str(current_user['_id'])})
+
+    user_id = auth.users_collection.insert_one({
+        'email': f'bench-{time.time()}@example.com',
+        'password': 'x' * 100,
+        'name': 'Benchmark'
+    }).inserted_id
+    token = jwt.encode({'user_id': str(user_id), 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       auth.JWT_SECRET, algorithm="HS256")
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    def run(ttl):
+        auth.principal_cache.ttl = ttl
+        auth.principal_cache.clear()
+        client.get('/whoami', headers=headers)
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            client.get('/whoami', headers=headers)
+        return (time.perf_counter() - start) / args.requests
+
+    uncached = run(0)
+    cached = run(60)
+    auth.users_collection.delete_one({'_id': user_id})
+
+    print(f"{args.requests} requests against {'MongoDB at ' + args.mongo_uri if args.mongo_uri else 'mongomock'}")
+    print(f"uncached   {uncached * 1e6:9.1f} us/request")
+    print(f"cached     {cached * 1e6:9.1f} us/request  ({uncached / cached:.2f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark: crisis detection cost against message length and phrase count
+
+Scans benign text (the worst case: no early exit) with automatons built from
+the shipped phrase file and from synthetic phrase sets of growing size. Time
+per character should stay flat across both dimensions.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_crisis [--rounds 20]
+"""
+import argparse
+import random
+import string
+from benchmarks.fixtures import best_of
+from config import Config
+from utils.crisis import CrisisDetector
+
+SAMPLE = ("Lately I have been thinking a lot about my work and my family, and how "
+          "the weekends never seem long enough to catch up on sleep or hobbies. ")
+
+def synthetic_phrases(count, seed=7):
+    rng = random.Random(seed)
+    def word():
+        # The "zq" prefix keeps synthetic phrases from matching the sample text
+        return 'zq' + ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 7)))
+    return [' '.join(word() for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark crisis phrase detection')
+    parser.add_argument('--rounds', type=int, default=20, help='Repetitions; the best time is reported')
+    args = parser.parse_args()
+
+    detectors = [('phrase file', CrisisDetector.from_file(Config.CRISIS_PHRASES_FILE))]
+    for count in (1000, 10000, 100000):
+        detectors.append((f'{count} synthetic', CrisisDetector(synthetic_phrases(count))))
+
+    lengths = (200, 2000, 20000, 200000)
+    print(f"{'phrases':<18}" + ''.join(f"{length:>14} ch" for length in lengths) + "   (ns per character)")
+    for name, detector in detectors:
+        row = f"{name:<18}"
+        for length in lengths:
+            text = (SAMPLE * (length // len(SAMPLE) + 1))[:length]
+            assert detector.find(text) is None
+            seconds = best_of(args.rounds, lambda: detector.find(text))
+            row += f"{seconds / length * 1e9:>17.1f}"
+        print(row + f"   [{detector.phrase_count} phrases]")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Micro-benchmark: per-call encrypt/decrypt loops versus encrypt_many/decrypt_many
+
+The decrypt cache is disabled so every call does real Fernet work.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_encryption [--messages 500] [--size 2000] [--rounds 5]
+"""
+import argparse
+
+from benchmarks.fixtures import configure_environment, best_of
+
+configure_environment(DECRYPT_CACHE_ENABLED='false')
+
+from utils.encryption import encrypt_message, decrypt_message, encrypt_many, decrypt_many, decrypt_cache
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch encryption against the per-call path')
+    parser.add_argument('--messages', type=int, default=500, help='Messages per batch')
+    parser.add_argument('--size', type=int, default=2000, help='Characters per message')
+    parser.add_argument('--rounds', type=int, default=5, help='Repetitions; the best time is reported')
+    args = parser.parse_args()
+
+    decrypt_cache.enabled = False
+    messages = [('How are you feeling today? ' * (args.size // 27 + 1))[:args.size]] * args.messages
+    encrypted = encrypt_many(messages)
+
+    results = [
+        ('encrypt_message loop', best_of(args.rounds, lambda: [encrypt_message(m) for m in messages])),
+        ('encrypt_many', best_of(args.rounds, lambda: encrypt_many(messages))),
+        ('decrypt_message loop', best_of(args.rounds, lambda: [decrypt_message(m) for m in encrypted])),
+        ('decrypt_many', best_of(args.rounds, lambda: decrypt_many(encrypted))),
+    ]
+
+    print(f"{args.messages} messages x {args.size} chars, best of {args.rounds}")
+    for i, (name, seconds) in enumerate(results):
+        speedup = f"  ({results[i - 1][1] / seconds:.2f}x)" if i % 2 else ""
+        print(f"{name:<22} {seconds * 1000:9.2f} ms  {args.messages / seconds:10.0f} msg/s{speedup}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: stored bytes per message and decode throughput by storage format
+
+Compares legacy base64 Fernet strings with the binary envelope, uncompressed
+and with each available codec, for short user messages and long assistant
+replies. Sizes are of the BSON-encoded message sub-document as it sits in a
+bucket; decode throughput is decrypt_many with the decrypt cache disabled.
+The sample text is drawn from a small set of sentences, so it compresses
+better than real conversations; treat the compressed sizes as a lower bound.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_envelope [--messages 500] [--rounds 3]
+"""
+import argparse
+import random
+from datetime import datetime
+
+from benchmarks.fixtures import configure_environment, best_of
+
+configure_environment(DECRYPT_CACHE_ENABLED='false')
+
+import bson
+from config import Config
+from utils.encryption import encrypt_many, decrypt_many, decrypt_cache
+
+SENTENCES = [
+    "It sounds like this week has asked a lot of you.",
+    "What do you notice in your body when that thought comes up?",
+    "You mentioned your sister earlier, and I wonder how she fits into this.",
+    "Sometimes the pressure we put on ourselves is louder than anything anyone else says.",
+    "Let's slow down for a moment and stay with that feeling.",
+    "I'm curious what a good day would look like for you right now.",
+    "That makes a lot of sense given everything you've been carrying.",
+    "Have there been times when you handled something similar in a way you felt good about?",
+    "I didn't sleep well again and work felt impossible.",
+    "My manager keeps moving deadlines and I can't keep up.",
+]
+
+def sample_messages(count, words, seed=11):
+    """Messages of roughly `words` words, assembled from varied sentences"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        text = []
+        while sum(len(s.split()) for s in text) < words:
+            text.append(rng.choice(SENTENCES))
+        messages.append(' '.join(text))
+    return messages
+
+def stored_size(content):
+    return len(bson.encode({'role': 'assistant', 'content': content, 'timestamp': datetime.utcnow()}))
+
+def formats():
+    yield 'legacy string', 'legacy', 'none'
+    yield 'binary', 'binary', 'none'
+    yield 'binary + zlib', 'binary', 'zlib'
+    try:
+        import zstandard  # noqa: F401
+        yield 'binary + zstd', 'binary', 'zstd'
+    except ImportError:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark message storage formats')
+    parser.add_argument('--messages', type=int, default=500, help='Messages per sample')
+    parser.add_argument('--rounds', type=int, default=3, help='Repetitions; the best time is reported')
+    args = parser.parse_args()
+
+    decrypt_cache.enabled = False
+    samples = [
+        ('user message (~25 words)', sample_messages(args.messages, 25)),
+        ('assistant reply (~600 words)', sample_messages(args.messages, 600)),
+    ]
+
+    for label, messages in samples:
+        plain = sum(len(m.encode('utf-8')) for m in messages) / len(messages)
+        print(f"{label}: {plain:.0f} plaintext bytes on average, {args.messages} messages, best of {args.rounds}")
+        baseline = None
+        for name, envelope, codec in formats():
+            Config.MESSAGE_ENVELOPE = envelope
+            Config.MESSAGE_COMPRESSION = codec
+            stored = encrypt_many(messages)
+            size = sum(stored_size(s) for s in stored) / len(stored)
+            baseline = baseline or size
+            seconds = best_of(args.rounds, lambda: decrypt_many(stored))
+            print(f"  {name:<16} {size:9.0f} B/msg ({size / baseline:6.1%})  {len(stored) / seconds:10.0f} decodes/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark: prompt building and history selection against history length
+
+Times build_prompt on plaintext histories of growing length (with and without
+a summary turn) and the pre-decryption budget selection over stored Fernet
+tokens. Selection should stay flat once the token budget binds, because only
+the newest turns that fit are walked. build_prompt still scans the whole list
+for the summary turn; the routes cap it at PROMPT_HISTORY_MAX_MESSAGES.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_prompt [--rounds 200] [--size 300]
+"""
+import argparse
+
+from benchmarks.fixtures import configure_environment, best_of
+
+configure_environment()
+
+from config import Config
+from utils.encryption import encrypt_many
+from utils.prompt import build_prompt, select_within_budget, estimate_encrypted_tokens
+
+def history_of(turns, size):
+    text = ('I keep replaying the conversation with my manager in my head. ' * (size // 63 + 1))[:size]
+    return [{"role": "user" if i % 2 == 0 else "model", "parts": [text]} for i in range(turns)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark prompt building')
+    parser.add_argument('--rounds', type=int, default=200, help='Repetitions; the best time is reported')
+    parser.add_argument('--size', type=int, default=300, help='Characters per history message')
+    args = parser.parse_args()
+
+    summary = [{"role": "summary", "parts": ["The client has been anxious about work for several weeks. " * 4]}]
+    budget = Config.PROMPT_HISTORY_TOKEN_BUDGET
+
+    print(f"{args.size}-char messages, history budget {budget} tokens, best of {args.rounds}")
+    print(f"{'turns':>6} {'build_prompt':>14} {'+ summary':>14} {'select stored':>15}")
+    for turns in (0, 10, 50, 200, 1000):
+        history = history_of(turns, args.size)
+        stored = [{'content': token} for token in encrypt_many([msg['parts'][0] for msg in history])]
+
+        plain = best_of(args.rounds, lambda: build_prompt('How do I stop overthinking?', history))
+        summarized = best_of(args.rounds, lambda: build_prompt('How do I stop overthinking?', summary + history))
+        selection = best_of(args.rounds, lambda: select_within_budget(
+            stored, budget, lambda msg: estimate_encrypted_tokens(msg['content'])))
+
+        print(f"{turns:>6} {plain * 1e6:11.1f} us {summarized * 1e6:11.1f} us {selection * 1e6:12.1f} us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark: the development server against the production gunicorn setup
+
+Starts the fake Gemini server here, then for each server in turn launches it
+as a subprocess (`python app.py`, then `gunicorn -c gunicorn.conf.py`, and
+gunicorn with SERVER_MODE=asgi when --asgi is given), waits for /readyz and
+runs benchmarks.load_http against it with the same settings.
+
+Servers run in their own processes, so they need a real MongoDB (e.g. a local
+mongod). Each run registers its own users, so runs can share a database.
+
+Usage (from the server directory):
+    python -m benchmarks.bench_serving --mongo-uri mongodb://localhost:27017 [--concurrency 50] [--requests 500]
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fixtures import free_port
+
+def wait_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/readyz', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server at {base_url} not ready after {timeout}s")
+
+def stop(process):
+    # The dev server's reloader forks a child; signal the whole process group
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the dev server with gunicorn under load')
+    parser.add_argument('--mongo-uri', required=True, help='MongoDB the servers connect to')
+    parser.add_argument('--phases', default='login,send,history', help='Phases passed to load_http')
+    parser.add_argument('--concurrency', type=int, default=50, help='Requests kept in flight')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per phase')
+    parser.add_argument('--users', type=int, default=20, help='Distinct users to spread requests over')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake Gemini seconds per reply')
+    parser.add_argument('--workers', type=int, help='Gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--asgi', action='store_true', help='Also run gunicorn with uvicorn workers')
+    args = parser.parse_args()
+
+    gemini = FakeGeminiServer(('127.0.0.1', 0), latency=args.latency).start()
+
+    servers = [
+        ('dev server (app.py)', [sys.executable, 'app.py'], {}),
+        ('gunicorn gthread', [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], {'SERVER_MODE': 'wsgi'}),
+    ]
+    if args.asgi:
+        servers.append(('gunicorn uvicorn', [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+                        {'SERVER_MODE': 'asgi'}))
+
+    for name, command, extra_env in servers:
+        port = free_port()
+        env = dict(os.environ, **extra_env)
+        env.update(
+            PORT=str(port),
+            MONGO_URI=args.mongo_uri,
+            GEMINI_BASE_URL=gemini.base_url,
+            RATE_LIMIT_ENABLED='false',
+            GUNICORN_ACCESS_LOG='/dev/null'
+        )
+        env.setdefault('ENCRYPTION_KEY', 'benchmark-key')
+        env.setdefault('JWT_SECRET_KEY', 'benchmark-secret-key-of-reasonable-length')
+        if args.workers:
+            env['WEB_CONCURRENCY'] = str(args.workers)
+
+        print(f"== {name}")
+        process = subprocess.Popen(command, env=env, start_new_session=True,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            wait_ready(base_url, process)
+            subprocess.run([
+                sys.executable, '-m', 'benchmarks.load_http', '--url', base_url,
+                '--phases', args.phases, '--concurrency', str(args.concurrency),
+                '--requests', str(args.requests), '--users', str(args.users)
+            ], check=True)
+        finally:
+            stop(process)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Local stand-in for the Gemini generateContent / streamGenerateContent API
+
+Point the server at it with GEMINI_BASE_URL=http://127.0.0.1:<port>/models/fake.
+Every request sleeps for the configured latency, so load tests exercise how
+the server waits on the upstream without touching Google.
+
+Usage (from the server directory):
+    python -m benchmarks.fake_gemini [--port 8089] [--latency 1.0]
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "Eve: That sounds like a lot to carry. What feels heaviest about it right now?"
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of upstream connections at once
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, chunks=4):
+        super().__init__(address, FakeGeminiHandler)
+        self.latency = latency
+        self.chunks = chunks
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/models/fake"
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def enter(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+def _body(text):
+    return {
+        'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}],
+        'usageMetadata': {'promptTokenCount': 400, 'candidatesTokenCount': 20, 'totalTokenCount': 420}
+    }
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.enter()
+        try:
+            if ':streamGenerateContent' in self.path:
+                self._stream()
+            else:
+                time.sleep(self.server.latency)
+                payload = json.dumps(_body(REPLY)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+        finally:
+            self.server.leave()
+
+    def _stream(self):
+        # Spread the latency over the chunks, like tokens arriving over time
+        words = REPLY.split(' ')
+        step = -(-len(words) // self.server.chunks)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for i in range(0, len(words), step):
+            time.sleep(self.server.latency / self.server.chunks)
+            text = ' '.join(words[i:i + step]) + ' '
+            self.wfile.write(f"data: {json.dumps(_body(text))}\r\n\r\n".encode())
+            self.wfile.flush()
+        self.close_connection = True
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Gemini API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=1.0, help='Seconds per response')
+    parser.add_argument('--chunks', type=int, default=4, help='Chunks per streamed response')
+    args = parser.parse_args()
+
+    server = FakeGeminiServer((args.host, args.port), latency=args.latency, chunks=args.chunks)
+    print(f"Fake Gemini listening; set GEMINI_BASE_URL={server.base_url}")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Shared setup for the benchmarks: environment, MongoDB stand-ins and reporting
+
+Benchmarks must call configure_environment (and use_mongomock when no real
+MongoDB is given) before importing anything from the app, because Config and
+the module-level MongoDB clients are created at import time.
+"""
+import os
+import socket
+import time
+
+def configure_environment(gemini_url=None, mongo_uri=None, **overrides):
+    """Point the app at the benchmark's Gemini and MongoDB, with throwaway secrets"""
+    os.environ.setdefault('ENCRYPTION_KEY', 'benchmark-key')
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret-key-of-reasonable-length')
+    if gemini_url:
+        os.environ['GEMINI_BASE_URL'] = gemini_url
+    if mongo_uri:
+        os.environ['MONGO_URI'] = mongo_uri
+    for key, value in overrides.items():
+        os.environ[key] = str(value)
+
+def use_mongomock(with_motor=False):
+    """
+    Replace the MongoDB drivers with in-memory mocks
+
+    Every MongoClient made afterwards shares one in-memory server, so the auth
+    and chat modules see the same data. The motor mock is a separate store.
+    """
+    import mongomock
+    import pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+    if with_motor:
+        import mongomock_motor
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def best_of(rounds, func):
+    """Run func `rounds` times and return the fastest wall time in seconds"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def print_latency_report(name, latencies, elapsed, failures):
+    """One line per endpoint: count, RPS, p50/p95/p99 in ms and failures"""
+    if not latencies:
+        print(f"{name:<10} no requests")
+        return
+    print(f"{name:<10} {len(latencies):7d} req {len(latencies) / elapsed:9.1f} req/s"
+          f"  p50 {percentile(latencies, 50) * 1000:8.1f} ms"
+          f"  p95 {percentile(latencies, 95) * 1000:8.1f} ms"
+          f"  p99 {percentile(latencies, 99) * 1000:8.1f} ms"
+          f"  failures {failures}")
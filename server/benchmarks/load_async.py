@@ -0,0 +1,108 @@
+"""
+Load test for the async serving mode
+
+Starts the fake Gemini server and the ASGI app (one uvicorn worker) in this
+process, then keeps --concurrency chats in flight against /api/chat/send.
+MongoDB is mocked with mongomock/mongomock-motor unless --mongo-uri is given.
+The peak number of simultaneous upstream calls shows how many chats a single
+worker process held open at once.
+
+Usage (from the server directory):
+    python -m benchmarks.load_async [--concurrency 200] [--requests 1000] [--latency 1.0]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fixtures import configure_environment, use_mongomock, free_port, percentile
+
+async def run(args):
+    import httpx
+    import jwt
+    import uvicorn
+    from asgi import create_asgi_app
+    from routes import auth
+    from routes.async_chat import get_db
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(create_asgi_app(), host='127.0.0.1', port=port,
+                                           log_level='warning', lifespan='on'))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # Seed users directly; password hashing is not what this test measures
+    tokens = []
+    for i in range(args.users):
+        user = {'email': f'load-{i}-{time.time()}@example.com', 'password': '', 'name': f'Load {i}'}
+        user_id = auth.users_collection.insert_one(dict(user)).inserted_id
+        if not args.mongo_uri:
+            # The sync and async mocks are separate in-memory databases
+            await get_db()['users'].insert_one({**user, '_id': user_id})
+        tokens.append(jwt.encode({'user_id': str(user_id), 'exp': datetime.utcnow() + timedelta(hours=1)},
+                                 auth.JWT_SECRET, algorithm="HS256"))
+
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=120) as client:
+        async def one(i):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post('/api/chat/send', json={'message': f'I have been feeling off lately ({i})'},
+                                                 headers={'Authorization': f'Bearer {tokens[i % len(tokens)]}'})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                if not ok:
+                    failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    server.should_exit = True
+    await serve_task
+    return latencies, failures, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the async chat routes')
+    parser.add_argument('--concurrency', type=int, default=200, help='Chats kept in flight')
+    parser.add_argument('--requests', type=int, default=1000, help='Total /api/chat/send calls')
+    parser.add_argument('--users', type=int, default=50, help='Distinct users to spread chats over')
+    parser.add_argument('--latency', type=float, default=1.0, help='Fake Gemini seconds per reply')
+    parser.add_argument('--mongo-uri', help='Use a real MongoDB instead of mongomock')
+    args = parser.parse_args()
+
+    gemini = FakeGeminiServer(('127.0.0.1', 0), latency=args.latency).start()
+    configure_environment(
+        gemini_url=gemini.base_url,
+        mongo_uri=args.mongo_uri,
+        RATE_LIMIT_ENABLED='false',
+        GEMINI_ASYNC_POOL_SIZE=args.concurrency
+    )
+    if not args.mongo_uri:
+        use_mongomock(with_motor=True)
+
+    import logging
+    logging.disable(logging.INFO)
+
+    latencies, failures, elapsed = asyncio.run(run(args))
+
+    print(f"{args.requests} chats, concurrency {args.concurrency}, upstream latency {args.latency:.2f}s, 1 worker process")
+    print(f"throughput      {args.requests / elapsed:8.1f} req/s")
+    print(f"latency p50     {percentile(latencies, 50) * 1000:8.1f} ms")
+    print(f"latency p95     {percentile(latencies, 95) * 1000:8.1f} ms")
+    print(f"latency p99     {percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"failures        {failures:8d}")
+    print(f"peak in flight  {gemini.peak_in_flight:8d} concurrent upstream calls")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Load test for the HTTP API: login, send and history
+
+By default starts the fake Gemini server and the Flask app (threaded werkzeug
+server) in this process, on mongomock unless --mongo-uri is given. With --url
+it drives an already running server instead (gunicorn, uvicorn asgi:...),
+which must itself be pointed at a fake Gemini to keep Google out of the loop.
+
+Each phase keeps --concurrency requests in flight until --requests have been
+made and reports RPS and p50/p95/p99 latency. Users are registered up front
+and are not part of the measurement. Rate limiting is disabled in-process;
+turn it off on an external server too (RATE_LIMIT_ENABLED=false).
+
+Usage (from the server directory):
+    python -m benchmarks.load_http [--concurrency 50] [--requests 500] [--latency 0.2]
+    python -m benchmarks.load_http --url http://127.0.0.1:5000 --phases send,history
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_gemini import FakeGeminiServer
+from benchmarks.fixtures import configure_environment, use_mongomock, free_port, print_latency_report
+
+PASSWORD = 'benchmark-password'
+
+def start_local_server(args):
+    """Serve create_app() from a daemon thread and return its base URL"""
+    gemini = FakeGeminiServer(('127.0.0.1', 0), latency=args.latency).start()
+    configure_environment(
+        gemini_url=gemini.base_url,
+        mongo_uri=args.mongo_uri,
+        RATE_LIMIT_ENABLED='false',
+        GEMINI_POOL_SIZE=args.concurrency,
+        GEMINI_MAX_IN_FLIGHT=args.concurrency
+    )
+    if not args.mongo_uri:
+        use_mongomock()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    port = free_port()
+    server = make_server('127.0.0.1', port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{port}'
+
+class Phase:
+    """Runs one request function with bounded concurrency and collects latencies"""
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self._local = threading.local()
+
+    def session(self):
+        # One keep-alive session per worker thread, like a browser tab
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def run(self, count, request):
+        latencies = []
+        failures = 0
+        lock = threading.Lock()
+
+        def one(i):
+            nonlocal failures
+            start = time.perf_counter()
+            try:
+                ok = request(self.session(), i)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    failures += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(one, range(count)))
+        return latencies, time.perf_counter() - start, failures
+
+def register_users(base_url, count):
+    """Create benchmark users and return (email, token) pairs"""
+    users = []
+    stamp = int(time.time() * 1000)
+    with requests.Session() as session:
+        for i in range(count):
+            email = f'load-{stamp}-{i}@example.com'
+            response = session.post(f'{base_url}/api/auth/register',
+                                    json={'email': email, 'password': PASSWORD, 'name': f'Load {i}'})
+            response.raise_for_status()
+            users.append((email, response.json()['token']))
+    return users
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test login, send and history')
+    parser.add_argument('--url', help='Drive an already running server instead of starting one')
+    parser.add_argument('--phases', default='login,send,history', help='Comma-separated phases to run, in order')
+    parser.add_argument('--concurrency', type=int, default=50, help='Requests kept in flight')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per phase')
+    parser.add_argument('--users', type=int, default=20, help='Distinct users to spread requests over')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake Gemini seconds per reply')
+    parser.add_argument('--stream', action='store_true', help='Send through /api/chat/send/stream')
+    parser.add_argument('--history-limit', type=int, default=50, help='Messages per history page')
+    parser.add_argument('--mongo-uri', help='Use a real MongoDB instead of mongomock')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/') if args.url else start_local_server(args)
+    users = register_users(base_url, args.users)
+
+    def auth(i):
+        return {'Authorization': f'Bearer {users[i % len(users)][1]}'}
+
+    def login(session, i):
+        response = session.post(f'{base_url}/api/auth/login',
+                                json={'email': users[i % len(users)][0], 'password': PASSWORD})
+        return response.status_code == 200
+
+    def send(session, i):
+        path = '/api/chat/send/stream' if args.stream else '/api/chat/send'
+        response = session.post(f'{base_url}{path}', headers=auth(i),
+                                json={'message': f'I have been feeling off lately ({i})'})
+        # Reading the body waits for the whole stream
+        return response.status_code == 200 and bool(response.content)
+
+    def history(session, i):
+        response = session.get(f'{base_url}/api/chat/history', headers=auth(i),
+                               params={'limit': args.history_limit})
+        return response.status_code == 200
+
+    phases = {'login': login, 'send': send, 'history': history}
+    selected = [name.strip() for name in args.phases.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in phases]
+    if unknown:
+        parser.error(f"unknown phase(s): {', '.join(unknown)}")
+
+    target = base_url if args.url else f'in-process Flask, fake Gemini latency {args.latency:.2f}s'
+    print(f"{target}; concurrency {args.concurrency}, {args.requests} requests per phase, {len(users)} users")
+    runner = Phase(args.concurrency)
+    for name in selected:
+        latencies, elapsed, failures = runner.run(args.requests, phases[name])
+        print_latency_report(name, latencies, elapsed, failures)
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,98 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     MONGO_URI = os.environ.get('MONGO_URI')
+    # Connection pool of the one MongoClient each process shares
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    # Threads per worker serving the Flask routes: gthread threads, or in ASGI
+    # mode the pool the WSGI adapter runs Flask on
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 16))
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=int(os.environ.get('JWT_ACCESS_TOKEN_EXPIRES', 3600)))
+    # Seconds an authenticated user stays cached; 0 disables the cache
+    AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 60))
+    AUTH_CACHE_MAX_USERS = int(os.environ.get('AUTH_CACHE_MAX_USERS', 10000))
     ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY')
-    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
\ No newline at end of file
+    # Pre-derived Fernet keys, comma separated, newest first; new data is encrypted
+    # with the first. A key derived from ENCRYPTION_KEY, if set, is tried last.
+    ENCRYPTION_KEYS = os.environ.get('ENCRYPTION_KEYS', '')
+    # How new messages are stored: 'binary' (compressed, BSON binary envelope) or
+    # 'legacy' (base64 Fernet strings, readable by older deployments). Both are always readable.
+    MESSAGE_ENVELOPE = os.environ.get('MESSAGE_ENVELOPE', 'binary')
+    # 'zlib', 'zstd' (needs the zstandard package) or 'none'
+    MESSAGE_COMPRESSION = os.environ.get('MESSAGE_COMPRESSION', 'zlib')
+    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+    
+    # Decrypted-message cache; set DECRYPT_CACHE_ENABLED=false to never retain plaintext
+    DECRYPT_CACHE_ENABLED = os.environ.get('DECRYPT_CACHE_ENABLED', 'true').lower() == 'true'
+    DECRYPT_CACHE_MAX_ENTRIES = int(os.environ.get('DECRYPT_CACHE_MAX_ENTRIES', 10000))
+    DECRYPT_CACHE_MAX_BYTES = int(os.environ.get('DECRYPT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    DECRYPT_CACHE_TTL = float(os.environ.get('DECRYPT_CACHE_TTL', 600))
+    CRYPTO_WORKERS = int(os.environ.get('CRYPTO_WORKERS', min(4, os.cpu_count() or 1)))
+    
+    # Per-user rate limit on chat turns
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', 20))
+    RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', 5))
+    
+    # One crisis phrase per line; loaded once at startup
+    CRISIS_PHRASES_FILE = os.environ.get('CRISIS_PHRASES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'crisis_phrases.txt'))
+    
+    # Chat storage
+    CHAT_BUCKET_SIZE = int(os.environ.get('CHAT_BUCKET_SIZE', 100))
+    CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE', 50))
+    CHAT_HISTORY_MAX_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_MAX_PAGE_SIZE', 200))
+    
+    # 'sync' writes each turn before responding; 'async' acknowledges first and writes behind
+    PERSISTENCE_MODE = os.environ.get('PERSISTENCE_MODE', 'sync')
+    WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 10000))
+    WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 200))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 0.05))
+    WRITE_BEHIND_MAX_RETRIES = int(os.environ.get('WRITE_BEHIND_MAX_RETRIES', 5))
+    
+    # Prompt assembly: history turns are picked newest first until the token budget is spent
+    PROMPT_HISTORY_MAX_MESSAGES = int(os.environ.get('PROMPT_HISTORY_MAX_MESSAGES', 10))
+    PROMPT_HISTORY_TOKEN_BUDGET = int(os.environ.get('PROMPT_HISTORY_TOKEN_BUDGET', 1000))
+    
+    # Rolling summary of every message older than what prompts include verbatim
+    SUMMARY_ENABLED = os.environ.get('SUMMARY_ENABLED', 'true').lower() == 'true'
+    SUMMARY_EVERY_TURNS = int(os.environ.get('SUMMARY_EVERY_TURNS', 10))
+    SUMMARY_MAX_WORDS = int(os.environ.get('SUMMARY_MAX_WORDS', 200))
+    SUMMARY_QUEUE_SIZE = int(os.environ.get('SUMMARY_QUEUE_SIZE', 1000))
+    
+    # Opt-in cache of first-turn replies; similarity 0 means exact matches only. Fuzzy
+    # matching can't tell "I am happy" from "I am not happy", so it is opt-in too
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+    RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_SIMILARITY = float(os.environ.get('RESPONSE_CACHE_SIMILARITY', 0))
+    
+    # Per-user conversation-context cache ('memory' or 'redis')
+    CONTEXT_CACHE_ENABLED = os.environ.get('CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+    CONTEXT_CACHE_BACKEND = os.environ.get('CONTEXT_CACHE_BACKEND', 'memory')
+    CONTEXT_CACHE_MAX_USERS = int(os.environ.get('CONTEXT_CACHE_MAX_USERS', 5000))
+    CONTEXT_CACHE_TTL = float(os.environ.get('CONTEXT_CACHE_TTL', 1800))
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # Gemini HTTP client
+    GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp')
+    # Keep-alive connections for the blocking client; a Flask thread that finds none
+    # free waits with no timeout, so this defaults to one per thread
+    GEMINI_POOL_SIZE = int(os.environ.get('GEMINI_POOL_SIZE', GUNICORN_THREADS))
+    GEMINI_ASYNC_POOL_SIZE = int(os.environ.get('GEMINI_ASYNC_POOL_SIZE', 100))
+    GEMINI_CONNECT_TIMEOUT = float(os.environ.get('GEMINI_CONNECT_TIMEOUT', 3.05))
+    GEMINI_READ_TIMEOUT = float(os.environ.get('GEMINI_READ_TIMEOUT', 30))
+    GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', 2))
+    GEMINI_BACKOFF_BASE = float(os.environ.get('GEMINI_BACKOFF_BASE', 0.5))
+    GEMINI_BACKOFF_MAX = float(os.environ.get('GEMINI_BACKOFF_MAX', 8))
+    # Gemini calls allowed in flight per process, and how long a turn may queue for a slot;
+    # the default never admits more blocking calls than GEMINI_POOL_SIZE can carry
+    GEMINI_MAX_IN_FLIGHT = int(os.environ.get('GEMINI_MAX_IN_FLIGHT', GEMINI_POOL_SIZE))
+    # The same for the async routes, which hold no thread per call and have their own pool
+    GEMINI_ASYNC_MAX_IN_FLIGHT = int(os.environ.get('GEMINI_ASYNC_MAX_IN_FLIGHT', GEMINI_ASYNC_POOL_SIZE))
+    GEMINI_ADMISSION_TIMEOUT = float(os.environ.get('GEMINI_ADMISSION_TIMEOUT', 5))
+    GEMINI_BREAKER_THRESHOLD = int(os.environ.get('GEMINI_BREAKER_THRESHOLD', 5))
+    GEMINI_BREAKER_COOLDOWN = float(os.environ.get('GEMINI_BREAKER_COOLDOWN', 30))
\ No newline at end of file
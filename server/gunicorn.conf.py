@@ -0,0 +1,67 @@
+"""
+Gunicorn settings for production
+
+    gunicorn -c gunicorn.conf.py                    # threaded WSGI workers (wsgi.py)
+    SERVER_MODE=asgi gunicorn -c gunicorn.conf.py   # uvicorn workers (asgi.py)
+
+A chat turn spends most of its time waiting on Gemini, so WSGI workers run
+many threads each; CPU-bound work (password hashing, Fernet) is spread over
+roughly one worker per core. In ASGI mode each worker's event loop holds the
+in-flight chats instead of threads. Every default can be overridden through
+the environment variables read below.
+"""
+import multiprocessing
+import os
+from config import Config
+
+server_mode = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+
+if server_mode == 'asgi':
+    wsgi_app = 'asgi:create_asgi_app()'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'wsgi:app'
+    worker_class = 'gthread'
+    # GEMINI_POOL_SIZE and GEMINI_MAX_IN_FLIGHT default to this; keep MONGO_MAX_POOL_SIZE at or above it
+    threads = Config.GUNICORN_THREADS
+
+# Build the app once in the master; workers inherit it copy-on-write
+preload_app = True
+
+# Long enough for a Gemini call with its retries; a worker stuck past it is restarted
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then so slow leaks can't accumulate; jitter avoids restarting all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall workers under container I/O limits
+worker_tmp_dir = os.environ.get('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before any worker is forked
+    from utils import db, encryption
+    # Pay for key derivation once; workers inherit the keyring
+    encryption.get_keyring()
+    # create_app talked to MongoDB (index creation); don't carry that pool into workers
+    db.close_client()
+
+def post_fork(server, worker):
+    # Sockets and threads don't survive a fork: give each worker its own
+    from utils import db, encryption, gemini
+    db.reset_client()
+    gemini.reset_session()
+    encryption.reset_executor()
+
+def worker_exit(server, worker):
+    # Write-behind mode: don't lose queued messages when a worker is recycled
+    from services.chat_turn import message_writer
+    message_writer.close()
@@ -0,0 +1,163 @@
+import asyncio
+import jwt
+from bson import ObjectId
+from quart import Blueprint, request, jsonify
+from motor.motor_asyncio import AsyncIOMotorClient
+from utils.gemini import get_gemini_response_async, close_async_client
+from utils.chat_store import append_messages_async, get_recent_messages_async, get_latest_timestamp_async
+from utils.metrics import timed
+from utils.summarizer import SUMMARY_PROBE, SUMMARY_FIELDS
+from utils.rate_limit import RateLimitExceeded, retry_after_header, user_limiter, gemini_async_admission
+from routes.auth import JWT_SECRET, PRINCIPAL_PROJECTION, principal_cache
+from services.chat_turn import (CRISIS_RESPONSE, CONTEXT_MESSAGES, context_cache, summarizer, message_writer,
+                                is_crisis_message, decrypt_turns, build_turn_messages, remember_turn)
+from config import Config
+
+# Async versions of the chat routes that wait on Gemini; served by asgi.py
+async_chat_bp = Blueprint('async_chat_bp', __name__)
+
+@async_chat_bp.errorhandler(RateLimitExceeded)
+async def rate_limited(e):
+    response = jsonify({'message': str(e)})
+    response.headers['Retry-After'] = retry_after_header(e.retry_after)
+    return response, 429
+
+# MongoDB setup; motor binds to the running event loop, so connect on first use
+_client = None
+
+def get_db():
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(
+            Config.MONGO_URI,
+            maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+            minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS
+        )
+    return _client['eve']
+
+async def close_clients():
+    """Flush queued writes and release the motor and httpx clients on shutdown"""
+    global _client
+    await asyncio.to_thread(message_writer.close)
+    if _client is not None:
+        _client.close()
+        _client = None
+    await close_async_client()
+
+def async_token_required(f):
+    async def decorated(*args, **kwargs):
+        token = None
+        if 'Authorization' in request.headers:
+            token = request.headers['Authorization'].replace('Bearer ', '')
+        
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 401
+        
+        try:
+            data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+            with timed('auth'):
+                current_user = principal_cache.get(data['user_id'])
+                if current_user is None:
+                    current_user = await get_db()['users'].find_one({'_id': ObjectId(data['user_id'])}, PRINCIPAL_PROJECTION)
+                    if current_user:
+                        principal_cache.set(data['user_id'], current_user)
+            if not current_user:
+                return jsonify({'message': 'User not found!'}), 401
+        except jwt.ExpiredSignatureError:
+            return jsonify({'message': 'Token expired!'}), 401
+        except Exception:
+            return jsonify({'message': 'Token is invalid!'}), 401
+            
+        return await f(current_user, *args, **kwargs)
+    
+    decorated.__name__ = f.__name__
+    return decorated
+
+async def load_chat_context_async(user_id):
+    """Return the user's summary and recent turns formatted for Gemini"""
+    return await load_summary_turns_async(user_id) + await load_recent_turns_async(user_id)
+
+async def load_summary_turns_async(user_id):
+    if not summarizer.enabled:
+        return []
+    chats = get_db()['chats']
+    with timed('mongo_read'):
+        probe = await chats.find_one({'user_id': ObjectId(user_id)}, SUMMARY_PROBE)
+    turns = summarizer.cached_turns(user_id, probe)
+    if turns is None:
+        with timed('mongo_read'):
+            chat = await chats.find_one({'user_id': ObjectId(user_id)}, SUMMARY_FIELDS)
+        turns = summarizer.remember(user_id, chat)
+    return turns
+
+async def load_recent_turns_async(user_id):
+    """Return the user's recent turns, from cache or MongoDB"""
+    collection = get_db()['chat_messages']
+    if context_cache.enabled:
+        latest = await get_latest_timestamp_async(collection, ObjectId(user_id))
+        chat_history = context_cache.get(user_id, latest)
+        if chat_history is not None:
+            return chat_history
+    
+    recent = await get_recent_messages_async(collection, ObjectId(user_id), CONTEXT_MESSAGES)
+    # Decryption is CPU work; keep it off the event loop
+    chat_history = await asyncio.to_thread(decrypt_turns, recent)
+    context_cache.set(user_id, chat_history, recent[-1]['timestamp'] if recent else None)
+    return chat_history
+
+async def chat_turn(current_user, user_message):
+    """Async run_chat_turn: answer one user message and persist the exchange"""
+    user_id = str(current_user['_id'])
+    
+    # Screen first: a user in crisis always gets the crisis response, never a 429
+    if is_crisis_message(user_message):
+        ai_response = CRISIS_RESPONSE
+    else:
+        user_limiter.check(user_id)
+        chat_history = await load_chat_context_async(user_id)
+        await gemini_async_admission.acquire_async()
+        try:
+            ai_response = await get_gemini_response_async(user_message, chat_history)
+        finally:
+            gemini_async_admission.release()
+    
+    # Encrypt once and persist with a single upsert
+    new_messages = build_turn_messages(user_message, ai_response)
+    if message_writer.is_async:
+        message_writer.submit(ObjectId(user_id), new_messages)
+    else:
+        await append_messages_async(get_db()['chat_messages'], ObjectId(user_id), new_messages)
+    remember_turn(user_id, user_message, ai_response, new_messages[-1]['timestamp'])
+    
+    return ai_response
+
+@async_chat_bp.route('/send', methods=['POST'])
+@async_token_required
+async def send_message(current_user):
+    data = await request.get_json()
+    if not data or not data.get('message'):
+        return jsonify({'message': 'No message provided!'}), 400
+    
+    ai_response = await chat_turn(current_user, data['message'])
+    
+    return jsonify({
+        'message': 'Message sent successfully!',
+        'response': ai_response
+    }), 200
+
+@async_chat_bp.route('/voice', methods=['POST'])
+@async_token_required
+async def process_voice(current_user):
+    data = await request.get_json()
+    if not data or not data.get('text'):
+        return jsonify({'message': 'No text provided!'}), 400
+    
+    ai_response = await chat_turn(current_user, data['text'])
+    
+    return jsonify({
+        'message': 'Voice message processed successfully!',
+        'response': ai_response
+    }), 200
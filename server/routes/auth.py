@@ -1,21 +1,90 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
+import threading
+import time
 from datetime import datetime, timedelta
-from pymongo import MongoClient
 from bson import ObjectId
 from config import Config
+from utils.db import collection
+from utils.metrics import timed
 
 auth_bp = Blueprint('auth_bp', __name__)
 
 # MongoDB setup
-client = MongoClient(Config.MONGO_URI)
-db = client['eve']
-users_collection = db['users']
+users_collection = collection('users')
 
 # JWT Secret
 JWT_SECRET = Config.JWT_SECRET_KEY
 
+# Fields token_required hands to the routes; the password hash never leaves MongoDB
+PRINCIPAL_PROJECTION = {'email': 1, 'name': 1}
+
+class PrincipalCache:
+    """
+    Short-lived cache of authenticated users keyed by user id
+    
+    Saves the users_collection lookup on every authenticated request. Entries
+    live for `ttl` seconds; call revoke_user when a user is deleted or must
+    lose access immediately.
+    """
+    def __init__(self, ttl, max_users):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, user_id):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return user
+    
+    def set(self, user_id, user):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_users:
+                # Drop the oldest insertion; dicts keep insertion order
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[user_id] = (user, time.monotonic() + self.ttl)
+    
+    def revoke(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache(Config.AUTH_CACHE_TTL, Config.AUTH_CACHE_MAX_USERS)
+
+def revoke_user(user_id):
+    """Evict a user from the principal cache so their next request hits MongoDB"""
+    principal_cache.revoke(str(user_id))
+
+def load_principal(user_id):
+    """Return the authenticated user's public fields, from cache or MongoDB"""
+    with timed('auth'):
+        current_user = principal_cache.get(user_id)
+        if current_user is None:
+            current_user = users_collection.find_one({'_id': ObjectId(user_id)}, PRINCIPAL_PROJECTION)
+            if current_user:
+                principal_cache.set(user_id, current_user)
+    return current_user
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -87,7 +156,7 @@ def token_required(f):
         
         try:
             data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            current_user = users_collection.find_one({'_id': ObjectId(data['user_id'])})
+            current_user = load_principal(data['user_id'])
             if not current_user:
                 return jsonify({'message': 'User not found!'}), 401
         except jwt.ExpiredSignatureError:
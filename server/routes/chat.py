@@ -1,21 +1,39 @@
-import re
-from flask import Blueprint, request, jsonify
-from datetime import datetime
+import hashlib
+import json
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from datetime import datetime, timezone
 from bson import ObjectId
-from pymongo import MongoClient
-from utils.encryption import encrypt_message, decrypt_message
-from utils.gemini import get_gemini_response
+from utils.encryption import decrypt_many
+from utils.gemini import StreamInterruptedError
+from utils.chat_store import get_messages_page, get_history_version
+from services.chat_turn import messages_collection, run_chat_turn, stream_chat_turn
+from utils.metrics import timed
+from utils.rate_limit import RateLimitExceeded, retry_after_header
 from routes.auth import token_required
 from config import Config
-import json
 
 chat_bp = Blueprint('chat_bp', __name__)
 
-# MongoDB setup
-client = MongoClient(Config.MONGO_URI)
-db = client['eve']
-users_collection = db['users']
-chats_collection = db['chats']
+@chat_bp.errorhandler(RateLimitExceeded)
+def rate_limited(e):
+    response = jsonify({'message': str(e)})
+    response.headers['Retry-After'] = retry_after_header(e.retry_after)
+    return response, 429
+
+def parse_cursor(value):
+    """Parse an ISO timestamp cursor into the naive UTC datetimes MongoDB returns"""
+    if not value:
+        return None
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    cursor = datetime.fromisoformat(value)
+    if cursor.tzinfo is not None:
+        cursor = cursor.astimezone(timezone.utc).replace(tzinfo=None)
+    return cursor
+
+def format_timestamp(timestamp):
+    """Stored timestamps are naive UTC; say so explicitly"""
+    return timestamp.isoformat() + 'Z'
 
 @chat_bp.route('/send', methods=['POST'])
 @token_required
@@ -24,84 +42,49 @@ def send_message(current_user):
     if not data or not data.get('message'):
         return jsonify({'message': 'No message provided!'}), 400
     
-    user_id = str(current_user['_id'])
-    user_message = data['message']
-    
-    # Check for crisis keywords
-    crisis_keywords = ['suicide', 'kill myself', 'end my life', 'want to die', 'harm myself']
-    is_crisis = any(keyword in user_message.lower() for keyword in crisis_keywords)
-    
-    if is_crisis:
-        # Provide crisis response instead of using the API
-        ai_response = """I'm deeply concerned about what you're sharing. Your life matters, and it's important you speak with someone immediately who can provide proper support. Please contact the National Suicide Prevention Lifeline at 988 or 1-800-273-8255, text HOME to 741741 to reach the Crisis Text Line, or go to your nearest emergency room. Would you like me to provide more resources that might help in this moment?"""
-    else:
-        # Encrypt user message
-        encrypted_message = encrypt_message(user_message)
-        
-        # Get chat history for context
-        chat_history = []
-        chat = chats_collection.find_one({'user_id': ObjectId(user_id)})
-        if chat and len(chat.get('messages', [])) > 0:
-            messages = chat.get('messages', [])
-            # Format the last few messages for Gemini
-            for msg in messages[-10:]:
-                role = "user" if msg['role'] == 'user' else "model"
-                content = decrypt_message(msg['content'])
-                chat_history.append({"role": role, "parts": [content]})
-        
-        # Generate response from Gemini
-        ai_response = get_gemini_response(user_message, chat_history)
-    
-    # Encrypt the response
-    encrypted_response = encrypt_message(ai_response)
-    
-    # Save to database
-    timestamp = datetime.utcnow()
-    
-    # Check if chat exists for user
-    if chat:
-        # Append to existing chat
-        chats_collection.update_one(
-            {'user_id': ObjectId(user_id)},
-            {'$push': {'messages': {
-                '$each': [
-                    {
-                        'role': 'user',
-                        'content': encrypted_message if not is_crisis else encrypt_message(user_message),
-                        'timestamp': timestamp
-                    },
-                    {
-                        'role': 'assistant',
-                        'content': encrypted_response,
-                        'timestamp': timestamp
-                    }
-                ]
-            }}}
-        )
-    else:
-        # Create new chat
-        chat_entry = {
-            'user_id': ObjectId(user_id),
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': encrypted_message if not is_crisis else encrypt_message(user_message),
-                    'timestamp': timestamp
-                },
-                {
-                    'role': 'assistant',
-                    'content': encrypted_response,
-                    'timestamp': timestamp
-                }
-            ]
-        }
-        chats_collection.insert_one(chat_entry)
+    ai_response = run_chat_turn(str(current_user['_id']), data['message'])
     
     return jsonify({
         'message': 'Message sent successfully!',
         'response': ai_response
     }), 200
 
+@chat_bp.route('/send/stream', methods=['POST'])
+@token_required
+def send_message_stream(current_user):
+    """Send a message and stream Eve's reply back as server-sent events"""
+    data = request.get_json()
+    if not data or not data.get('message'):
+        return jsonify({'message': 'No message provided!'}), 400
+    
+    # Raises RateLimitExceeded here, before any of the stream has been sent
+    chunks_stream = stream_chat_turn(str(current_user['_id']), data['message'])
+    
+    def sse(payload, event=None):
+        frame = f"event: {event}\n" if event else ""
+        return frame + f"data: {json.dumps(payload)}\n\n"
+    
+    def generate():
+        chunks = []
+        try:
+            for chunk in chunks_stream:
+                chunks.append(chunk)
+                yield sse({'delta': chunk})
+        except StreamInterruptedError:
+            # Nothing was persisted; the client should discard the partial reply
+            yield sse({'message': 'The reply was interrupted, please try again.'}, event='error')
+            return
+        
+        # stream_chat_turn has persisted the exchange by now
+        ai_response = ''.join(chunks).strip()
+        yield sse({'message': 'Message sent successfully!', 'response': ai_response}, event='done')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @chat_bp.route('/initial', methods=['GET'])
 @token_required
 def get_initial_message(current_user):
@@ -116,23 +99,54 @@ def get_initial_message(current_user):
 @chat_bp.route('/history', methods=['GET'])
 @token_required
 def get_chat_history(current_user):
+    """
+    Get a page of chat history
+    
+    Query params:
+        before (str, optional): ISO timestamp; return messages older than this
+        after (str, optional): ISO timestamp; return messages newer than this
+            (timestamps without an offset are taken as UTC)
+        limit (int, optional): Page size, capped at CHAT_HISTORY_MAX_PAGE_SIZE
+    """
     user_id = str(current_user['_id'])
     
-    # Get chat history
-    chat = chats_collection.find_one({'user_id': ObjectId(user_id)})
-    if not chat:
-        return jsonify({'messages': []}), 200
+    try:
+        before = parse_cursor(request.args.get('before'))
+        after = parse_cursor(request.args.get('after'))
+        limit = int(request.args.get('limit', Config.CHAT_HISTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'message': 'Invalid pagination parameters!'}), 400
+    limit = max(1, min(limit, Config.CHAT_HISTORY_MAX_PAGE_SIZE))
     
-    # Decrypt messages
+    # Nothing new has been written since the client's copy of this page
+    version = get_history_version(messages_collection, ObjectId(user_id))
+    etag = hashlib.sha256(f"{user_id}:{version}:{request.query_string.decode()}".encode()).hexdigest()
+    if etag in request.if_none_match:
+        return '', 304
+    
+    page, has_more = get_messages_page(messages_collection, ObjectId(user_id), limit, before=before, after=after)
+    
+    # Decrypt only the requested page
     decrypted_messages = []
-    for message in chat['messages']:
+    with timed('decrypt'):
+        contents = decrypt_many([message['content'] for message in page])
+    for message, content in zip(page, contents):
         decrypted_messages.append({
             'role': message['role'],
-            'content': decrypt_message(message['content']),
-            'timestamp': message['timestamp'].isoformat()
+            'content': content,
+            'timestamp': format_timestamp(message['timestamp'])
         })
     
-    return jsonify({'messages': decrypted_messages}), 200
+    response = jsonify({
+        'messages': decrypted_messages,
+        'has_more': has_more,
+        # Cursors for the next page in either direction
+        'before': decrypted_messages[0]['timestamp'] if decrypted_messages else None,
+        'after': decrypted_messages[-1]['timestamp'] if decrypted_messages else None
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response, 200
 
 @chat_bp.route('/voice', methods=['POST'])
 @token_required
@@ -141,76 +155,7 @@ def process_voice(current_user):
     if not data or not data.get('text'):
         return jsonify({'message': 'No text provided!'}), 400
     
-    user_id = str(current_user['_id'])
-    user_message = data['text']
-    
-    # Check for crisis keywords
-    crisis_keywords = ['suicide', 'kill myself', 'end my life', 'want to die', 'harm myself']
-    is_crisis = any(keyword in user_message.lower() for keyword in crisis_keywords)
-    
-    if is_crisis:
-        # Provide crisis response instead of using the API
-        ai_response = """I'm deeply concerned about what you're sharing. Your life matters, and it's important you speak with someone immediately who can provide proper support. Please contact the National Suicide Prevention Lifeline at 988 or 1-800-273-8255, text HOME to 741741 to reach the Crisis Text Line, or go to your nearest emergency room. Would you like me to provide more resources that might help in this moment?"""
-    else:
-        # Encrypt user message
-        encrypted_message = encrypt_message(user_message)
-        
-        # Get chat history for context
-        chat_history = []
-        chat = chats_collection.find_one({'user_id': ObjectId(user_id)})
-        if chat and len(chat.get('messages', [])) > 0:
-            messages = chat.get('messages', [])
-            # Format the last few messages for Gemini
-            for msg in messages[-10:]:
-                role = "user" if msg['role'] == 'user' else "model"
-                content = decrypt_message(msg['content'])
-                chat_history.append({"role": role, "parts": [content]})
-        
-        # Generate response from Gemini
-        ai_response = get_gemini_response(user_message, chat_history)
-    
-    # Encrypt the response
-    encrypted_response = encrypt_message(ai_response)
-    
-    # Save to database
-    timestamp = datetime.utcnow()
-    
-    # Same database logic as the text message route
-    if chat:
-        chats_collection.update_one(
-            {'user_id': ObjectId(user_id)},
-            {'$push': {'messages': {
-                '$each': [
-                    {
-                        'role': 'user',
-                        'content': encrypted_message if not is_crisis else encrypt_message(user_message),
-                        'timestamp': timestamp
-                    },
-                    {
-                        'role': 'assistant',
-                        'content': encrypted_response,
-                        'timestamp': timestamp
-                    }
-                ]
-            }}}
-        )
-    else:
-        chat_entry = {
-            'user_id': ObjectId(user_id),
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': encrypted_message if not is_crisis else encrypt_message(user_message),
-                    'timestamp': timestamp
-                },
-                {
-                    'role': 'assistant',
-                    'content': encrypted_response,
-                    'timestamp': timestamp
-                }
-            ]
-        }
-        chats_collection.insert_one(chat_entry)
+    ai_response = run_chat_turn(str(current_user['_id']), data['text'])
     
     return jsonify({
         'message': 'Voice message processed successfully!',
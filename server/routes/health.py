@@ -0,0 +1,32 @@
+import logging
+from flask import Blueprint, jsonify
+from utils.db import ping
+from utils.gemini import breaker
+
+logger = logging.getLogger(__name__)
+
+# Probes for the process manager / load balancer; no authentication
+health_bp = Blueprint('health_bp', __name__)
+
+@health_bp.route('/healthz', methods=['GET'])
+def liveness():
+    """The process is up and serving requests"""
+    return jsonify({'status': 'ok'}), 200
+
+@health_bp.route('/readyz', methods=['GET'])
+def readiness():
+    """The process can do useful work: MongoDB answers"""
+    checks = {}
+    try:
+        ping()
+        checks['mongo'] = 'ok'
+    except Exception as e:
+        logger.error(f"Readiness check failed: MongoDB unreachable: {str(e)}")
+        checks['mongo'] = 'unavailable'
+    
+    # Reported but not gating: every instance shares the same upstream, and Eve
+    # still answers with fallback replies while the circuit is open
+    checks['gemini'] = 'circuit open' if breaker.is_open else 'ok'
+    
+    ready = checks['mongo'] == 'ok'
+    return jsonify({'status': 'ready' if ready else 'unavailable', 'checks': checks}), 200 if ready else 503
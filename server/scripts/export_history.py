@@ -0,0 +1,410 @@
+"""
+Stream chat history out of MongoDB as NDJSON or Parquet
+
+Two exports:
+
+  messages  One row per message with its decrypted content. An aggregation
+            unwinds the `chat_messages` buckets server-side and a cursor
+            streams the rows, so no user's history is ever held in memory.
+            Contents are decrypted in parallel batches.
+  stats     One row per user: message counts by role, first and last
+            message, number of sessions (runs of messages with no gap longer
+            than --session-gap minutes) and plaintext characters. Sizes come
+            from the storage envelope or the ciphertext length, so nothing is
+            decrypted.
+
+Rerun the same command to resume. NDJSON checkpoints after every batch and
+is truncated back to the last checkpoint, so resumed exports contain no
+duplicates. Parquet (requires pyarrow) writes numbered part files of
+--rows-per-file rows into the output directory. A part is only readable once
+closed, so Parquet checkpoints each time a part is finished and a resumed
+export rewrites the part it was in the middle of. Plaintext is written to
+disk: keep exports on encrypted storage and delete them when done.
+
+Usage (from the server directory):
+    python -m scripts.export_history messages --output export.ndjson [--user-id ID ...]
+    python -m scripts.export_history stats --output stats.ndjson
+    python -m scripts.export_history messages --format parquet --output export/
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from utils import envelope
+from utils.db import get_db
+from utils.encryption import decrypt_many, decrypt_cache
+from utils.prompt import FERNET_OVERHEAD_BYTES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def message_pipeline(user_ids, last_bucket=None, last_index=-1):
+    """Unwind buckets into message rows in (bucket _id, index) order, after the checkpoint"""
+    match = {}
+    if user_ids:
+        match['user_id'] = {'$in': user_ids}
+    if last_bucket is not None:
+        match['_id'] = {'$gte': last_bucket}
+    pipeline = [
+        {'$match': match},
+        {'$sort': {'_id': ASCENDING}},
+        {'$unwind': {'path': '$messages', 'includeArrayIndex': 'index'}},
+    ]
+    if last_bucket is not None:
+        pipeline.append({'$match': {'$or': [
+            {'_id': {'$gt': last_bucket}},
+            {'index': {'$gt': last_index}}
+        ]}})
+    pipeline.append({'$project': {
+        '_id': 0,
+        'bucket_id': '$_id',
+        'index': 1,
+        'user_id': 1,
+        'role': '$messages.role',
+        'content': '$messages.content',
+        'timestamp': '$messages.timestamp'
+    }})
+    return pipeline
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def decrypt_rows(rows):
+    """Replace each row's ciphertext with plaintext; failures are recorded, not fatal"""
+    contents = decrypt_many([row['content'] for row in rows], return_exceptions=True)
+    for row, content in zip(rows, contents):
+        if isinstance(content, Exception):
+            row['content'] = None
+            row['error'] = str(content)
+        else:
+            row['content'] = content
+            row['error'] = None
+    return rows
+
+def plaintext_chars(content):
+    """Approximate plaintext size of a stored message without decrypting it"""
+    size = envelope.plaintext_size(content)
+    if size is None:
+        size = max(0, len(content) * 3 // 4 - FERNET_OVERHEAD_BYTES)
+    return size
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class NdjsonWriter:
+    """Appends JSON lines; `position` is the resumable byte offset"""
+    # Every write is flushed and synced, so any batch boundary can be checkpointed
+    committed = True
+
+    def __init__(self, path, offset):
+        if path == '-':
+            if offset:
+                raise ValueError("Cannot resume an export written to stdout")
+            self._file = sys.stdout.buffer
+        else:
+            self._file = open(path, 'r+b' if offset else 'wb')
+            # Drop anything written after the last checkpoint
+            self._file.truncate(offset)
+            self._file.seek(offset)
+        self.path = path
+
+    def write(self, rows):
+        self._file.write(b''.join(
+            json.dumps(row, default=_json_default, ensure_ascii=False).encode('utf-8') + b'\n'
+            for row in rows
+        ))
+        self._file.flush()
+        if self.path != '-':
+            os.fsync(self._file.fileno())
+
+    def position(self):
+        return self._file.tell() if self.path != '-' else 0
+
+    def size(self):
+        return self.position()
+
+    def close(self):
+        if self.path != '-':
+            self._file.close()
+
+class ParquetWriter:
+    """
+    Writes one row group per batch into numbered part files in the output directory
+
+    A part is written under a .partial name and renamed once closed, because
+    Parquet files are unreadable until their footer is written. `position` is
+    the number of finished parts; `committed` is true right after a part is
+    finished, the only points where a checkpoint can safely be taken.
+    """
+    def __init__(self, directory, schema, parts=0, rows_per_file=100000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("--format parquet requires the pyarrow package")
+        self._pa = pyarrow
+        self._schema = pyarrow.schema(schema)
+        self.directory = directory
+        self.parts = parts
+        self.rows_per_file = rows_per_file
+        self._writer = None
+        self._rows = 0
+        self._bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        # Parts left half-written by an interrupted run are rewritten from the checkpoint
+        for name in os.listdir(directory):
+            if name.endswith('.parquet.partial'):
+                os.remove(os.path.join(directory, name))
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"part-{self.parts:05d}.parquet")
+
+    @property
+    def committed(self):
+        return self._writer is None
+
+    def write(self, rows):
+        if self._writer is None:
+            self._writer = self._pa.parquet.ParquetWriter(f"{self.path}.partial", self._schema)
+        columns = {name: [_parquet_value(row.get(name)) for row in rows] for name in self._schema.names}
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+        self._rows += len(rows)
+        if self._rows >= self.rows_per_file:
+            self._finish_part()
+
+    def _finish_part(self):
+        self._writer.close()
+        self._writer = None
+        os.replace(f"{self.path}.partial", self.path)
+        self._bytes += os.path.getsize(self.path)
+        self._rows = 0
+        self.parts += 1
+
+    def position(self):
+        return self.parts
+
+    def size(self):
+        return self._bytes
+
+    def close(self):
+        if self._writer is not None:
+            self._finish_part()
+
+def _parquet_value(value):
+    return str(value) if isinstance(value, ObjectId) else value
+
+def _message_schema():
+    import pyarrow
+    return [
+        ('user_id', pyarrow.string()), ('bucket_id', pyarrow.string()), ('index', pyarrow.int64()),
+        ('role', pyarrow.string()), ('content', pyarrow.string()),
+        ('timestamp', pyarrow.timestamp('ms')), ('error', pyarrow.string())
+    ]
+
+def _stats_schema():
+    import pyarrow
+    return [
+        ('user_id', pyarrow.string()), ('messages', pyarrow.int64()),
+        ('user_messages', pyarrow.int64()), ('assistant_messages', pyarrow.int64()),
+        ('sessions', pyarrow.int64()), ('plaintext_chars', pyarrow.int64()),
+        ('first_message', pyarrow.timestamp('ms')), ('last_message', pyarrow.timestamp('ms'))
+    ]
+
+class Checkpoint:
+    """JSON sidecar recording how far an export got; written atomically, or kept in memory when path is None"""
+    def __init__(self, path, job):
+        self.path = path
+        self.state = {'job': job, 'rows': 0, 'offset': 0}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('job') != job:
+                raise ValueError(f"Checkpoint {path} belongs to a different export; delete it to start over")
+            self.state = saved
+
+    @property
+    def resuming(self):
+        return self.state['rows'] > 0
+
+    def save(self, **updates):
+        self.state.update(updates)
+        if self.path is None:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+class Progress:
+    """Logs rows and rows/s at most every `interval` seconds, and a final summary"""
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.started = self.last_report = time.monotonic()
+        self.rows = 0
+
+    def add(self, count, size):
+        self.rows += count
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self._log(now, size)
+
+    def _log(self, now, size, final=False):
+        elapsed = max(now - self.started, 1e-9)
+        written = f", {size / 1e6:.1f} MB written" if size else ""
+        logger.info(f"{'Exported' if final else 'Exporting:'} {self.rows} rows in {elapsed:.1f}s "
+                    f"({self.rows / elapsed:.0f} rows/s{written})")
+
+    def finish(self, size):
+        self._log(time.monotonic(), size, final=True)
+
+def _finish(writer, checkpoint, reached):
+    """Close a Parquet part left open by the last batch and checkpoint the end of the export"""
+    if not writer.committed:
+        writer.close()
+        checkpoint.save(offset=writer.position(), **reached)
+
+def export_messages(collection, writer, checkpoint, user_ids, batch_size):
+    state = checkpoint.state
+    last_bucket = ObjectId(state['last_bucket']) if state.get('last_bucket') else None
+    cursor = collection.aggregate(
+        message_pipeline(user_ids, last_bucket, state.get('last_index', -1)),
+        allowDiskUse=True,
+        batchSize=batch_size
+    )
+    progress = Progress()
+    total = state['rows']
+    reached = None
+    for rows in batched(cursor, batch_size):
+        writer.write(decrypt_rows(rows))
+        total += len(rows)
+        reached = {'rows': total, 'last_bucket': str(rows[-1]['bucket_id']), 'last_index': rows[-1]['index']}
+        if writer.committed:
+            checkpoint.save(offset=writer.position(), **reached)
+        progress.add(len(rows), writer.size())
+    cursor.close()
+    _finish(writer, checkpoint, reached)
+    progress.finish(writer.size())
+
+def iter_user_stats(collection, user_ids, after_user, session_gap):
+    """
+    Yield one stats row per user, users in descending id order
+
+    Buckets are read in the order of the (user_id, timestamp) index, so each
+    user's messages arrive together and oldest first; only the current user's
+    running totals are kept.
+    """
+    query = {}
+    if user_ids:
+        query['user_id'] = {'$in': user_ids}
+    if after_user is not None:
+        query.setdefault('user_id', {})['$lt'] = after_user
+    cursor = collection.find(
+        query,
+        {'user_id': 1, 'messages.role': 1, 'messages.content': 1, 'messages.timestamp': 1}
+    ).sort([('user_id', DESCENDING), ('timestamp', ASCENDING)]).batch_size(100)
+
+    current = None
+    previous = None
+    for bucket in cursor:
+        if current is None or bucket['user_id'] != current['user_id']:
+            if current is not None:
+                yield current
+            current = {
+                'user_id': bucket['user_id'], 'messages': 0, 'user_messages': 0, 'assistant_messages': 0,
+                'sessions': 0, 'plaintext_chars': 0, 'first_message': None, 'last_message': None
+            }
+            previous = None
+        for message in bucket.get('messages', []):
+            current['messages'] += 1
+            current['user_messages' if message['role'] == 'user' else 'assistant_messages'] += 1
+            current['plaintext_chars'] += plaintext_chars(message['content'])
+            timestamp = message['timestamp']
+            if previous is None or (timestamp - previous).total_seconds() > session_gap:
+                current['sessions'] += 1
+            previous = timestamp
+            current['first_message'] = min(current['first_message'] or timestamp, timestamp)
+            current['last_message'] = max(current['last_message'] or timestamp, timestamp)
+    cursor.close()
+    if current is not None:
+        yield current
+
+def export_stats(collection, writer, checkpoint, user_ids, batch_size, session_gap):
+    state = checkpoint.state
+    after_user = ObjectId(state['last_user']) if state.get('last_user') else None
+    progress = Progress()
+    total = state['rows']
+    reached = None
+    for rows in batched(iter_user_stats(collection, user_ids, after_user, session_gap), batch_size):
+        writer.write(rows)
+        total += len(rows)
+        reached = {'rows': total, 'last_user': str(rows[-1]['user_id'])}
+        if writer.committed:
+            checkpoint.save(offset=writer.position(), **reached)
+        progress.add(len(rows), writer.size())
+    _finish(writer, checkpoint, reached)
+    progress.finish(writer.size())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('export', choices=['messages', 'stats'], help='What to export')
+    parser.add_argument('--output', required=True,
+                        help="NDJSON file ('-' for stdout), or a directory for --format parquet")
+    parser.add_argument('--format', choices=['ndjson', 'parquet'], default='ndjson')
+    parser.add_argument('--user-id', action='append', default=[], help='Only export these users (repeatable)')
+    parser.add_argument('--batch-size', type=int, default=500, help='Rows decrypted and written per batch')
+    parser.add_argument('--rows-per-file', type=int, default=100000,
+                        help='Rows per Parquet part file; Parquet checkpoints once per part')
+    parser.add_argument('--session-gap', type=float, default=30, help='Minutes of silence that end a session (stats)')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint.json)')
+    args = parser.parse_args()
+
+    if args.output == '-' and args.format == 'parquet':
+        parser.error("Parquet output needs a directory")
+    # Streaming to stdout can't be resumed, so its checkpoint stays in memory
+    checkpoint_path = args.checkpoint or (
+        None if args.output == '-' else f"{args.output.rstrip(os.sep)}.checkpoint.json"
+    )
+    job = {'export': args.export, 'format': args.format, 'user_ids': sorted(args.user_id)}
+    checkpoint = Checkpoint(checkpoint_path, job)
+    if checkpoint.resuming:
+        logger.info(f"Resuming after {checkpoint.state['rows']} rows")
+
+    # Every message is read once; caching plaintext would only hold it in memory longer
+    decrypt_cache.enabled = False
+
+    if args.format == 'parquet':
+        writer = ParquetWriter(args.output, _message_schema() if args.export == 'messages' else _stats_schema(),
+                               checkpoint.state['offset'], args.rows_per_file)
+    else:
+        writer = NdjsonWriter(args.output, checkpoint.state['offset'])
+
+    user_ids = [ObjectId(user_id) for user_id in args.user_id]
+    collection = get_db()['chat_messages']
+    try:
+        if args.export == 'messages':
+            export_messages(collection, writer, checkpoint, user_ids, args.batch_size)
+        else:
+            export_stats(collection, writer, checkpoint, user_ids, args.batch_size, args.session_gap * 60)
+    finally:
+        writer.close()
+
+if __name__ == '__main__':
+    main()
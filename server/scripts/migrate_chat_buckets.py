@@ -0,0 +1,92 @@
+"""
+Migrate chat history from one document per user into bucketed message documents
+
+Each `chats` document's `messages` array is split into buckets of
+CHAT_BUCKET_SIZE messages in the `chat_messages` collection, then the array is
+removed from the source document. Buckets written for a chat carry its id in
+`migrated_from`, so a run interrupted half-way can simply be restarted.
+Migrated buckets are never left open: the user's next turn starts a new
+bucket, so new messages always sort after migrated ones.
+
+The bucketed code never reads `chats.messages`, so users must be migrated
+before it serves them. Deploy in this order:
+
+    1. With the old code still live, run with --keep-source. Every user's
+       history is copied into buckets and the array is left in place.
+    2. Deploy the bucketed code. From here on nothing writes `chats.messages`.
+    3. Run again without --keep-source. Each chat's buckets are rebuilt from
+       its full array, which picks up turns written between steps 1 and 2,
+       and the array is removed.
+
+Never run without --keep-source while the old code can still write turns:
+a later rerun rebuilds a chat's buckets from whatever is left in its array,
+and turns migrated earlier would be lost.
+
+Usage (from the server directory):
+    python -m scripts.migrate_chat_buckets [--dry-run] [--keep-source]
+"""
+import argparse
+import logging
+from datetime import datetime
+from utils.db import get_db
+from utils.chat_store import BUCKET_SIZE, ensure_indexes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def build_buckets(chat):
+    """Split a legacy chat document's messages into bucket documents"""
+    messages = chat.get('messages', [])
+    buckets = []
+    for i in range(0, len(messages), BUCKET_SIZE):
+        chunk = messages[i:i + BUCKET_SIZE]
+        buckets.append({
+            'user_id': chat['user_id'],
+            'start': chunk[0]['timestamp'],
+            'timestamp': chunk[-1]['timestamp'],
+            'count': len(chunk),
+            'messages': chunk,
+            'migrated_from': chat['_id']
+        })
+    return buckets
+
+def migrate(chats_collection, messages_collection, dry_run=False, keep_source=False):
+    ensure_indexes(messages_collection)
+
+    migrated = 0
+    total_messages = 0
+    # Only documents that still hold an embedded array need migrating
+    for chat in chats_collection.find({'messages.0': {'$exists': True}}):
+        buckets = build_buckets(chat)
+        total_messages += len(chat['messages'])
+        migrated += 1
+        if dry_run:
+            continue
+
+        # Drop buckets left behind by an interrupted earlier run before rewriting them
+        messages_collection.delete_many({'migrated_from': chat['_id']})
+        messages_collection.insert_many(buckets, ordered=True)
+
+        if not keep_source:
+            chats_collection.update_one(
+                {'_id': chat['_id']},
+                {'$unset': {'messages': ''}, '$set': {'migrated_at': datetime.utcnow()}}
+            )
+
+        if migrated % 100 == 0:
+            logger.info(f"Migrated {migrated} chats ({total_messages} messages)")
+
+    logger.info(f"{'Would migrate' if dry_run else 'Migrated'} {migrated} chats ({total_messages} messages)")
+    return migrated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='Count what would be migrated without writing')
+    parser.add_argument('--keep-source', action='store_true', help='Leave the messages array on the legacy documents')
+    args = parser.parse_args()
+
+    db = get_db()
+    migrate(db['chats'], db['chat_messages'], dry_run=args.dry_run, keep_source=args.keep_source)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Re-encrypt stored chat data under the newest encryption key
+
+Walks the `chat_messages` buckets in _id order and rewrites every message
+under the first key in ENCRYPTION_KEYS, then does the same for the encrypted
+summaries on `chats` documents. Work is done in batches with one bulk_write
+each and throttled to --max-per-second documents so the job can run next to
+live traffic. Progress is checkpointed in the `maintenance` collection after
+every batch; rerunning with the same primary key resumes where the last run
+stopped.
+
+To rotate keys:
+    1. Generate a key:  python -m scripts.rotate_encryption_keys --generate-key
+    2. Prepend it to ENCRYPTION_KEYS (keeping the old keys after it) and deploy
+       to every worker, so new writes use it and old data still decrypts.
+    3. Run this job. Once it finishes, old keys can be removed.
+
+Usage (from the server directory):
+    python -m scripts.rotate_encryption_keys [--batch-size 100] [--max-per-second 200] [--restart]
+    python -m scripts.rotate_encryption_keys --derive-key   # print ENCRYPTION_KEY's derived key
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+from cryptography.fernet import Fernet
+from pymongo import UpdateOne
+from utils.db import get_db
+from utils.encryption import get_encryption_key, primary_key_id, rotate_message
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_ID = 'encryption_key_rotation'
+
+class Throttle:
+    """Sleeps just enough to keep the long-run rate at or under `per_second`"""
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.started = time.monotonic()
+        self.done = 0
+
+    def wait(self, count):
+        self.done += count
+        if self.per_second <= 0:
+            return
+        ahead = self.done / self.per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+def load_checkpoint(maintenance_collection, key, restart):
+    """Return the checkpoint for rotating to `key`, starting over if the key changed"""
+    checkpoint = maintenance_collection.find_one({'_id': CHECKPOINT_ID})
+    if restart or not checkpoint or checkpoint.get('key_id') != key:
+        checkpoint = {
+            '_id': CHECKPOINT_ID,
+            'key_id': key,
+            'phase': 'messages',
+            'last_id': None,
+            'rotated': 0,
+            'started_at': datetime.utcnow()
+        }
+        maintenance_collection.replace_one({'_id': CHECKPOINT_ID}, checkpoint, upsert=True)
+    return checkpoint
+
+def save_checkpoint(maintenance_collection, checkpoint):
+    checkpoint['updated_at'] = datetime.utcnow()
+    maintenance_collection.replace_one({'_id': CHECKPOINT_ID}, checkpoint, upsert=True)
+
+def bucket_update(bucket, key):
+    """
+    Update rotating one bucket's messages, or None if it is already done
+
+    Contents are set by array index rather than replacing the whole array,
+    so messages appended concurrently by the app are never overwritten.
+    """
+    if bucket.get('key_id') == key:
+        return None
+    updates = {'key_id': key}
+    for i, message in enumerate(bucket.get('messages', [])):
+        updates[f'messages.{i}.content'] = rotate_message(message['content'])
+    return UpdateOne({'_id': bucket['_id']}, {'$set': updates})
+
+def summary_update(chat, key):
+    if chat.get('summary_key_id') == key or not chat.get('summary'):
+        return None
+    return UpdateOne({'_id': chat['_id']}, {'$set': {
+        'summary': rotate_message(chat['summary']),
+        'summary_key_id': key
+    }})
+
+def rotate_collection(collection, projection, build_update, checkpoint, maintenance_collection,
+                      batch_size, throttle, dry_run):
+    """Rotate one collection in _id order from the checkpoint; return documents rewritten"""
+    key = checkpoint['key_id']
+    rotated = 0
+    while True:
+        query = {} if checkpoint['last_id'] is None else {'_id': {'$gt': checkpoint['last_id']}}
+        documents = list(collection.find(query, projection).sort('_id', 1).limit(batch_size))
+        if not documents:
+            return rotated
+
+        operations = [op for op in (build_update(document, key) for document in documents) if op is not None]
+        if operations and not dry_run:
+            collection.bulk_write(operations, ordered=False)
+        rotated += len(operations)
+
+        checkpoint['last_id'] = documents[-1]['_id']
+        checkpoint['rotated'] += len(operations)
+        if not dry_run:
+            save_checkpoint(maintenance_collection, checkpoint)
+        logger.info(f"{collection.name}: rotated {checkpoint['rotated']} documents so far (through {checkpoint['last_id']})")
+        throttle.wait(len(documents))
+
+def rotate(db, batch_size=100, max_per_second=200, restart=False, dry_run=False):
+    """Run (or resume) the rotation of every encrypted field to the primary key"""
+    key = primary_key_id()
+    maintenance = db['maintenance']
+    checkpoint = load_checkpoint(maintenance, key, restart)
+    if checkpoint['phase'] == 'done':
+        logger.info(f"Everything is already encrypted with key {key}; pass --restart to rotate again")
+        return checkpoint
+
+    throttle = Throttle(max_per_second)
+    if checkpoint['phase'] == 'messages':
+        rotate_collection(db['chat_messages'], {'messages.content': 1, 'key_id': 1}, bucket_update,
+                          checkpoint, maintenance, batch_size, throttle, dry_run)
+        checkpoint.update(phase='summaries', last_id=None)
+        if not dry_run:
+            save_checkpoint(maintenance, checkpoint)
+
+    if checkpoint['phase'] == 'summaries':
+        rotate_collection(db['chats'], {'summary': 1, 'summary_key_id': 1}, summary_update,
+                          checkpoint, maintenance, batch_size, throttle, dry_run)
+        checkpoint.update(phase='done', last_id=None, finished_at=datetime.utcnow())
+        if not dry_run:
+            save_checkpoint(maintenance, checkpoint)
+
+    logger.info(f"{'Would rotate' if dry_run else 'Rotated'} {checkpoint['rotated']} documents to key {key}")
+    return checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=100, help='Documents read and written per batch')
+    parser.add_argument('--max-per-second', type=float, default=200, help='Throttle in documents per second; 0 for none')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and rescan everything')
+    parser.add_argument('--dry-run', action='store_true', help='Count what would be rotated without writing')
+    parser.add_argument('--generate-key', action='store_true', help='Print a new Fernet key and exit')
+    parser.add_argument('--derive-key', action='store_true',
+                        help="Print ENCRYPTION_KEY's derived key for ENCRYPTION_KEYS and exit")
+    args = parser.parse_args()
+
+    if args.generate_key:
+        print(Fernet.generate_key().decode())
+        return
+    if args.derive_key:
+        print(get_encryption_key().decode())
+        return
+
+    rotate(get_db(), batch_size=args.batch_size, max_per_second=args.max_per_second,
+           restart=args.restart, dry_run=args.dry_run)
+
+if __name__ == '__main__':
+    main()
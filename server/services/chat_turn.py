@@ -0,0 +1,165 @@
+from datetime import datetime
+from bson import ObjectId
+from utils.encryption import encrypt_message, decrypt_many
+from utils.gemini import get_gemini_response, stream_gemini_response
+from utils.chat_store import get_recent_messages, get_latest_timestamp
+from utils.context_cache import create_context_cache
+from utils.prompt import select_stored_history
+from utils.summarizer import ConversationSummarizer
+from utils.write_behind import WriteBehindQueue
+from utils.crisis import detector
+from utils.metrics import timed
+from utils.rate_limit import user_limiter, gemini_admission
+from config import Config
+from utils.db import collection
+
+# One chat turn, shared by the text, voice and streaming routes:
+#   crisis screen -> rate limit -> context (cache or MongoDB) -> Gemini slot -> Gemini
+#   -> encrypt once -> one upsert
+
+# MongoDB setup
+chats_collection = collection('chats')
+messages_collection = collection('chat_messages')
+
+# Messages matching a crisis phrase skip the model and get this response
+CRISIS_RESPONSE = """I'm deeply concerned about what you're sharing. Your life matters, and it's important you speak with someone immediately who can provide proper support. Please contact the National Suicide Prevention Lifeline at 988 or 1-800-273-8255, text HOME to 741741 to reach the Crisis Text Line, or go to your nearest emergency room. Would you like me to provide more resources that might help in this moment?"""
+
+# Most previous messages fed to Gemini as context; the token budget usually binds first
+CONTEXT_MESSAGES = Config.PROMPT_HISTORY_MAX_MESSAGES
+
+# Persists messages inline or write-behind, per PERSISTENCE_MODE
+message_writer = WriteBehindQueue(messages_collection)
+
+# Recent decrypted turns per user, so a send usually skips the MongoDB read
+context_cache = create_context_cache(CONTEXT_MESSAGES)
+
+# Folds messages older than the context window into a running summary, off the request path
+summarizer = ConversationSummarizer(chats_collection, messages_collection, CONTEXT_MESSAGES)
+
+def is_crisis_message(user_message):
+    """Check for crisis phrases"""
+    return detector.is_crisis(user_message)
+
+def load_chat_context(user_id):
+    """Return the user's summary and recent turns formatted for Gemini"""
+    return summarizer.summary_turns(user_id) + load_recent_turns(user_id)
+
+def load_recent_turns(user_id):
+    """Return the user's recent turns, from cache or MongoDB"""
+    if context_cache.enabled:
+        # An index-only probe: is the cached context missing turns another worker wrote?
+        latest = get_latest_timestamp(messages_collection, ObjectId(user_id))
+        chat_history = context_cache.get(user_id, latest)
+        if chat_history is not None:
+            return chat_history
+
+    recent = get_recent_messages(messages_collection, ObjectId(user_id), CONTEXT_MESSAGES)
+    chat_history = decrypt_turns(recent)
+    context_cache.set(user_id, chat_history, recent[-1]['timestamp'] if recent else None)
+    return chat_history
+
+def decrypt_turns(recent):
+    """Decrypt stored messages into Gemini-format turns, skipping those over the token budget"""
+    # Only decrypt the turns the prompt builder will actually have room for
+    recent = select_stored_history(recent)
+    with timed('decrypt'):
+        contents = decrypt_many([msg['content'] for msg in recent])
+    chat_history = []
+    for msg, content in zip(recent, contents):
+        role = "user" if msg['role'] == 'user' else "model"
+        chat_history.append({"role": role, "parts": [content]})
+    return chat_history
+
+def build_turn_messages(user_message, ai_response):
+    """Encrypt each side of an exchange exactly once, ready for storage"""
+    timestamp = datetime.utcnow()
+    with timed('encrypt'):
+        return [
+            {
+                'role': 'user',
+                'content': encrypt_message(user_message),
+                'timestamp': timestamp
+            },
+            {
+                'role': 'assistant',
+                'content': encrypt_message(ai_response),
+                'timestamp': timestamp
+            }
+        ]
+
+def remember_turn(user_id, user_message, ai_response, timestamp):
+    """Write a persisted exchange through to the context cache"""
+    context_cache.append(user_id, [
+        {"role": "user", "parts": [user_message]},
+        {"role": "model", "parts": [ai_response]}
+    ], timestamp)
+    summarizer.note_turn(user_id)
+
+def complete_turn(user_id, user_message, ai_response):
+    """Persist an exchange with a single bucket upsert and update the caches"""
+    new_messages = build_turn_messages(user_message, ai_response)
+    message_writer.submit(ObjectId(user_id), new_messages)
+    remember_turn(user_id, user_message, ai_response, new_messages[-1]['timestamp'])
+
+def run_chat_turn(user_id, user_message):
+    """
+    Answer one user message and persist the exchange
+
+    Args:
+        user_id (str): The authenticated user's id
+        user_message (str): The user's message
+
+    Returns:
+        str: Eve's reply
+
+    Raises:
+        RateLimitExceeded: The user is over their rate limit, or no Gemini slot freed up in time
+    """
+    # Screen first: a user in crisis always gets the crisis response, never a 429
+    if is_crisis_message(user_message):
+        # Provide crisis response instead of using the API
+        ai_response = CRISIS_RESPONSE
+    else:
+        user_limiter.check(user_id)
+        chat_history = load_chat_context(user_id)
+        with gemini_admission:
+            ai_response = get_gemini_response(user_message, chat_history)
+
+    complete_turn(user_id, user_message, ai_response)
+    return ai_response
+
+def stream_chat_turn(user_id, user_message):
+    """
+    Like run_chat_turn, but returns a generator yielding the reply in chunks as Gemini produces it
+
+    Rate limiting and Gemini admission happen before this returns, so a
+    rejected turn raises RateLimitExceeded while the route can still answer
+    429; crisis messages are exempt from both. The exchange is persisted once the stream has been fully consumed;
+    if the upstream fails part-way the generator raises StreamInterruptedError
+    and nothing is persisted.
+    """
+    if is_crisis_message(user_message):
+        # Provide crisis response instead of using the API
+        return _stream_turn(user_id, user_message, [CRISIS_RESPONSE])
+
+    user_limiter.check(user_id)
+    chat_history = load_chat_context(user_id)
+    gemini_admission.acquire()
+    try:
+        chunks = stream_gemini_response(user_message, chat_history)
+    except Exception:
+        gemini_admission.release()
+        raise
+    return _stream_turn(user_id, user_message, chunks, release=gemini_admission.release)
+
+def _stream_turn(user_id, user_message, chunks, release=None):
+    received = []
+    try:
+        for chunk in chunks:
+            received.append(chunk)
+            yield chunk
+    finally:
+        # Free the Gemini slot even when the client disconnects mid-stream
+        if release is not None:
+            release()
+    complete_turn(user_id, user_message, ''.join(received).strip())
@@ -0,0 +1,147 @@
+"""
+Shared test setup
+
+Config and the MongoDB clients are created at import time, so the environment
+and the in-memory MongoDB stand-in are set up here, before any test imports
+the app. Run from the server directory:
+
+    python -m pytest -q tests
+"""
+import json
+import os
+import sys
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('ENCRYPTION_KEY', 'test-key')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret-key-of-reasonable-length')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017')
+os.environ.setdefault('GEMINI_BASE_URL', 'http://127.0.0.1:9/models/unused')
+
+import mongomock
+import pymongo
+pymongo.MongoClient = mongomock.MongoClient
+
+from config import Config
+
+def gemini_body(text):
+    return {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]}
+
+class StubGeminiServer(ThreadingHTTPServer):
+    """
+    Local Gemini stand-in that answers from a script of (status, body) responses
+
+    Once the script runs out every request gets a 200 with `reply`, streamed
+    a few words per event on streamGenerateContent.
+    """
+    daemon_threads = True
+
+    def __init__(self, reply="Eve: I'm here with you."):
+        super().__init__(('127.0.0.1', 0), StubGeminiHandler)
+        self.reply = reply
+        self.script = deque()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/models/stub"
+
+    def respond(self, *statuses):
+        """Queue responses; an int is a bare status, anything else is (status, body)"""
+        for status in statuses:
+            self.script.append(status if isinstance(status, tuple) else (status, {'error': status}))
+
+    def stream(self, *chunks, fail_after=None):
+        """Queue a streamed reply; with `fail_after` the connection drops after that many events"""
+        self.script.append((200, {'chunks': list(chunks), 'fail_after': fail_after}))
+
+    def next_response(self, streaming=False):
+        with self._lock:
+            self.requests += 1
+            if self.script:
+                return self.script.popleft()
+        if streaming:
+            words = self.reply.split(' ')
+            return 200, {'chunks': [' '.join(words[i:i + 2]) + ' ' for i in range(0, len(words), 2)]}
+        return 200, gemini_body(self.reply)
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        streaming = ':streamGenerateContent' in self.path
+        status, body = self.server.next_response(streaming)
+        if streaming and status == 200:
+            return self.send_stream(body['chunks'], body.get('fail_after'))
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, chunks, fail_after):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, text in enumerate(chunks):
+            if i == fail_after:
+                # Hang up without the final chunk, so the client sees a truncated body
+                self.close_connection = True
+                return
+            event = f"data: {json.dumps(gemini_body(text))}\r\n\r\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+@pytest.fixture
+def gemini_stub(monkeypatch):
+    """A running StubGeminiServer that utils.gemini talks to, with retries that don't sleep"""
+    from utils import gemini
+    server = StubGeminiServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(gemini, 'GEMINI_BASE_URL', server.base_url)
+    monkeypatch.setattr(Config, 'GEMINI_BACKOFF_BASE', 0)
+    monkeypatch.setattr(gemini, 'breaker', gemini.CircuitBreaker(threshold=2, cooldown=0.05))
+    gemini.reset_session()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app()
+    app.testing = True
+    return app
+
+@pytest.fixture
+def client(app):
+    """Test client over an empty database and cold caches"""
+    from routes.auth import principal_cache
+    from services.chat_turn import context_cache, messages_collection
+    from utils.chat_store import ensure_indexes
+    from utils.db import get_client
+    get_client().drop_database('eve')
+    ensure_indexes(messages_collection)
+    principal_cache.clear()
+    context_cache.backend = type(context_cache.backend)(Config.CONTEXT_CACHE_MAX_USERS, Config.CONTEXT_CACHE_TTL)
+    return app.test_client()
+
+def register(client, email='client@example.com'):
+    """Register a user; return (user_id, Authorization headers)"""
+    response = client.post('/api/auth/register', json={'email': email, 'password': 'correct horse battery'})
+    assert response.status_code == 201, response.get_json()
+    body = response.get_json()
+    return body['user_id'], {'Authorization': f"Bearer {body['token']}"}
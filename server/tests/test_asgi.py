@@ -0,0 +1,84 @@
+import asyncio
+import json
+import threading
+import time
+
+from asgi import PooledWsgiToAsgi
+
+def call(asgi_app, path='/', method='GET', body=b''):
+    """Drive one HTTP request through an ASGI app; return (status, headers, body)"""
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'root_path': '',
+             'query_string': b'', 'headers': [(b'content-type', b'application/json'),
+                                              (b'content-length', str(len(body)).encode())],
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await asgi_app(scope, receive, send)
+
+    return run, messages
+
+def response(messages):
+    start = messages[0]
+    return start['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+class RecordingApp:
+    """WSGI app that notes the thread it ran on and whether its iterable was closed"""
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.threads = []
+        self.closed = 0
+
+    def __call__(self, environ, start_response):
+        self.threads.append(threading.current_thread().name)
+        time.sleep(self.delay)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        app = self
+
+        class Body:
+            def __iter__(self):
+                yield b'hello '
+                yield b'world'
+
+            def close(self):
+                app.closed += 1
+
+        return Body()
+
+def test_requests_run_on_the_pool_and_are_closed():
+    wsgi = RecordingApp()
+    run, messages = call(PooledWsgiToAsgi(wsgi, threads=2))
+    asyncio.run(run())
+
+    assert response(messages) == (200, b'hello world')
+    assert messages[-1] == {'type': 'http.response.body'}
+    assert wsgi.threads[0].startswith('wsgi')
+    assert wsgi.closed == 1
+
+def test_slow_requests_do_not_queue_behind_each_other():
+    wsgi = RecordingApp(delay=0.2)
+    adapter = PooledWsgiToAsgi(wsgi, threads=4)
+    runs = [call(adapter)[0] for _ in range(4)]
+
+    async def run_all():
+        await asyncio.gather(*(run() for run in runs))
+
+    started = time.monotonic()
+    asyncio.run(run_all())
+    assert time.monotonic() - started < 0.6
+    assert len(set(wsgi.threads)) > 1
+
+def test_flask_routes_are_served(app, client):
+    run, messages = call(PooledWsgiToAsgi(app, threads=2), '/api/auth/register', 'POST',
+                         json.dumps({'email': 'asgi@example.com', 'password': 'correct horse battery'}).encode())
+    asyncio.run(run())
+
+    status, body = response(messages)
+    assert status == 201
+    assert 'token' in json.loads(body)
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+from utils import chat_store
+from utils.chat_store import append_messages, ensure_indexes, get_messages_page, get_recent_messages
+
+START = datetime(2026, 1, 1)
+
+def message(i):
+    return {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'm{i}',
+            'timestamp': START + timedelta(minutes=i)}
+
+def contents(messages):
+    return [m['content'] for m in messages]
+
+@pytest.fixture
+def collection(monkeypatch):
+    monkeypatch.setattr(chat_store, 'BUCKET_SIZE', 6)
+    collection = mongomock.MongoClient().db.chat_messages
+    ensure_indexes(collection)
+    return collection
+
+def test_turns_fill_one_bucket_then_roll_over(collection):
+    user_id = ObjectId()
+    for i in range(0, 10, 2):
+        append_messages(collection, user_id, [message(i), message(i + 1)])
+
+    buckets = list(collection.find({'user_id': user_id}).sort('_id', 1))
+    assert [b['count'] for b in buckets] == [6, 4]
+    assert [b.get('open') for b in buckets] == [None, True]
+    assert contents(get_recent_messages(collection, user_id, 4)) == ['m6', 'm7', 'm8', 'm9']
+
+def test_older_bucket_with_room_is_never_appended_to(collection):
+    user_id = ObjectId()
+    # Half-full buckets that are not open, e.g. written before a migration finished
+    for i in (0, 2):
+        collection.insert_one({'user_id': user_id, 'start': message(i)['timestamp'],
+                               'timestamp': message(i + 1)['timestamp'], 'count': 2,
+                               'messages': [message(i), message(i + 1)]})
+    for i in range(4, 10, 2):
+        append_messages(collection, user_id, [message(i), message(i + 1)])
+
+    assert contents(get_recent_messages(collection, user_id, 4)) == ['m6', 'm7', 'm8', 'm9']
+    page, has_more = get_messages_page(collection, user_id, 50)
+    assert contents(page) == [f'm{i}' for i in range(10)]
+    assert not has_more
+
+def test_only_one_open_bucket_per_user(collection):
+    user_id = ObjectId()
+    append_messages(collection, user_id, [message(0), message(1)])
+    with pytest.raises(Exception):
+        collection.insert_one({'user_id': user_id, 'open': True, 'count': 0, 'messages': []})
@@ -0,0 +1,110 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import register
+from services import chat_turn
+from utils.context_cache import ContextCache, InMemoryContextBackend, RedisContextBackend
+
+T0 = datetime(2026, 1, 1)
+
+def turn(text):
+    return [{"role": "user", "parts": [text]}, {"role": "model", "parts": [f"re: {text}"]}]
+
+class FakeRedis:
+    """The slice of redis-py's client the Redis backend uses, kept in a dict"""
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    def get(self, key):
+        if key in self.expiry and self.expiry[key] <= time.monotonic():
+            self.delete(key)
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        if ex is not None:
+            self.expiry[key] = time.monotonic() + ex
+
+    def delete(self, key):
+        self.data.pop(key, None)
+        self.expiry.pop(key, None)
+
+@pytest.fixture(params=['memory', 'redis'])
+def cache(request):
+    if request.param == 'memory':
+        backend = InMemoryContextBackend(max_users=10, ttl=60)
+    else:
+        backend = RedisContextBackend(FakeRedis(), ttl=60)
+    return ContextCache(backend, max_messages=4)
+
+def test_miss_then_hit(cache):
+    assert cache.get('u1') is None
+    cache.set('u1', turn('a'), T0)
+    assert cache.get('u1') == turn('a')
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_append_writes_through_and_trims(cache):
+    cache.set('u1', turn('a'), T0)
+    cache.append('u1', turn('b'), T0 + timedelta(minutes=1))
+    cache.append('u1', turn('c'), T0 + timedelta(minutes=2))
+    assert cache.get('u1') == turn('b') + turn('c')
+
+def test_append_leaves_uncached_users_alone(cache):
+    cache.append('u1', turn('a'), T0)
+    assert cache.get('u1') is None
+
+def test_entry_older_than_latest_message_is_a_miss(cache):
+    cache.set('u1', turn('a'), T0)
+    assert cache.get('u1', latest=T0) == turn('a')
+    # Another worker persisted a turn this cache never saw
+    assert cache.get('u1', latest=T0 + timedelta(seconds=1)) is None
+
+def test_invalidate(cache):
+    cache.set('u1', turn('a'), T0)
+    cache.invalidate('u1')
+    assert cache.get('u1') is None
+
+def test_disabled_cache_never_hits():
+    cache = ContextCache(InMemoryContextBackend(10, 60), max_messages=4, enabled=False)
+    cache.set('u1', turn('a'), T0)
+    assert cache.get('u1') is None
+
+def test_memory_backend_evicts_least_recently_used():
+    cache = ContextCache(InMemoryContextBackend(max_users=2, ttl=60), max_messages=4)
+    cache.set('u1', turn('a'))
+    cache.set('u2', turn('b'))
+    cache.get('u1')
+    cache.set('u3', turn('c'))
+    assert cache.get('u2') is None
+    assert cache.get('u1') == turn('a')
+
+def test_memory_backend_expires_entries():
+    cache = ContextCache(InMemoryContextBackend(max_users=2, ttl=0.01), max_messages=4)
+    cache.set('u1', turn('a'))
+    time.sleep(0.02)
+    assert cache.get('u1') is None
+
+def test_workers_see_each_others_turns(client, gemini_stub, monkeypatch):
+    """Two processes with their own in-memory caches serve one user in turn"""
+    user_id, _ = register(client)
+    prompts = []
+    real_response = chat_turn.get_gemini_response
+
+    def recording_response(user_message, chat_history=None):
+        prompts.append([part for t in chat_history for part in t['parts']])
+        return real_response(user_message, chat_history)
+
+    monkeypatch.setattr(chat_turn, 'get_gemini_response', recording_response)
+    worker_a = ContextCache(InMemoryContextBackend(10, 60), chat_turn.CONTEXT_MESSAGES)
+    worker_b = ContextCache(InMemoryContextBackend(10, 60), chat_turn.CONTEXT_MESSAGES)
+
+    for worker, message in ((worker_a, 'first'), (worker_b, 'second'), (worker_a, 'third')):
+        monkeypatch.setattr(chat_turn, 'context_cache', worker)
+        chat_turn.run_chat_turn(user_id, message)
+
+    # Worker A's cached context predates the turn worker B handled
+    assert 'second' in prompts[-1]
+    assert prompts[-1][:2] == ['first', "I'm here with you."]
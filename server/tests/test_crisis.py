@@ -0,0 +1,37 @@
+import logging
+
+import pytest
+
+from config import Config
+from utils.crisis import CrisisDetector, detector, tokenize
+
+def test_tokenize_folds_case_accents_and_substitutions():
+    assert tokenize("I can't... SU1CIIIDE, café") == ['i', 'cant', 'suicide', 'cafe']
+
+@pytest.mark.parametrize('phrase, message', [
+    ('want to die', 'Honestly I want to die today'),
+    ('хочу умереть', 'Я очень ХОЧУ умереть.'),
+    ('أريد أن أموت', 'أنا أريد أن أموت'),
+    ('死にたい', 'もう死にたいです'),
+    ('我想死', '我想死了'),
+])
+def test_phrases_in_any_script_match(phrase, message):
+    crisis = CrisisDetector([phrase, 'unrelated phrase'])
+    assert crisis.phrase_count == 2
+    assert crisis.find(message) == phrase
+
+def test_matches_respect_word_boundaries():
+    crisis = CrisisDetector(['want to die', 'хочу умереть'])
+    assert not crisis.is_crisis('I want to dine out')
+    assert not crisis.is_crisis('хочу умереться')
+
+def test_phrase_without_letters_is_reported(caplog):
+    with caplog.at_level(logging.WARNING, logger='utils.crisis'):
+        crisis = CrisisDetector(['kill myself', '!!!'])
+    assert crisis.phrase_count == 1
+    assert "'!!!'" in caplog.text
+
+def test_shipped_phrase_file_loads_every_phrase():
+    with open(Config.CRISIS_PHRASES_FILE, encoding='utf-8') as f:
+        phrases = {line.strip() for line in f if line.strip() and not line.startswith('#')}
+    assert detector.phrase_count == len({tuple(tokenize(p)) for p in phrases})
@@ -0,0 +1,53 @@
+import importlib.util
+
+import pytest
+
+from config import Config
+from utils import encryption
+from utils.encryption import decrypt_many, decrypt_message, encrypt_many, encrypt_message
+
+CODECS = ['none', 'zlib', pytest.param('zstd', marks=pytest.mark.skipif(
+    importlib.util.find_spec('zstandard') is None, reason='zstandard is not installed'))]
+
+MESSAGES = ['hi', 'I keep thinking about what my father said. ' * 30, 'ça va, 大丈夫 🙂 ' * 20]
+
+@pytest.fixture(autouse=True)
+def no_decrypt_cache(monkeypatch):
+    # encrypt_message seeds the cache with the plaintext; make decryption do the work
+    monkeypatch.setattr(encryption.decrypt_cache, 'enabled', False)
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_envelope_round_trip(monkeypatch, codec):
+    monkeypatch.setattr(Config, 'MESSAGE_COMPRESSION', codec)
+    for message in MESSAGES:
+        sealed = encrypt_message(message)
+        assert isinstance(sealed, bytes)
+        assert decrypt_message(sealed) == message
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip_on_the_crypto_pool(monkeypatch, codec):
+    monkeypatch.setattr(Config, 'MESSAGE_COMPRESSION', codec)
+    monkeypatch.setattr(Config, 'CRYPTO_WORKERS', 4)
+    messages = [f'{i}: ' + MESSAGES[i % len(MESSAGES)] for i in range(200)]
+    # Parallel chunks each compress and decompress on their own thread
+    assert decrypt_many(encrypt_many(messages)) == messages
+
+def test_compressed_envelopes_decrypt_whatever_the_current_codec(monkeypatch):
+    monkeypatch.setattr(Config, 'MESSAGE_COMPRESSION', 'zlib')
+    sealed = encrypt_message(MESSAGES[1])
+    monkeypatch.setattr(Config, 'MESSAGE_COMPRESSION', 'none')
+    assert decrypt_message(sealed) == MESSAGES[1]
+
+def test_legacy_string_ciphertext(monkeypatch):
+    monkeypatch.setattr(Config, 'MESSAGE_ENVELOPE', 'legacy')
+    legacy = encrypt_message(MESSAGES[1])
+    assert isinstance(legacy, str)
+    monkeypatch.setattr(Config, 'MESSAGE_ENVELOPE', 'binary')
+    assert decrypt_message(legacy) == MESSAGES[1]
+    assert decrypt_many([legacy, encrypt_message('new')]) == [MESSAGES[1], 'new']
+
+@pytest.mark.skipif(importlib.util.find_spec('zstandard') is not None, reason='zstandard is installed')
+def test_zstd_without_the_package_fails_loudly(monkeypatch):
+    monkeypatch.setattr(Config, 'MESSAGE_COMPRESSION', 'zstd')
+    with pytest.raises(RuntimeError, match='zstandard'):
+        encrypt_message(MESSAGES[1])
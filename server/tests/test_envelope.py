@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import envelope
+
+@pytest.mark.parametrize('codec', ['none', 'zlib'])
+def test_compress_round_trips(codec):
+    data = b'I had a long day and wanted to talk it through. ' * 8
+    assert envelope.decompress(envelope.compress(data, codec)) == data
+
+def test_short_messages_are_stored_uncompressed():
+    assert envelope.compress(b'hi', 'zlib') == b'\x00hi'
+
+def test_zstd_round_trips_across_threads():
+    pytest.importorskip('zstandard')
+    messages = [f'message {i}: '.encode() + b'how are you feeling today? ' * (i % 40 + 5) for i in range(2000)]
+
+    def round_trip(data):
+        return envelope.decompress(envelope.compress(data, 'zstd'))
+
+    with ThreadPoolExecutor(16) as pool:
+        assert list(pool.map(round_trip, messages)) == messages
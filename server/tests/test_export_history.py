@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+from scripts import export_history
+from scripts.export_history import Checkpoint, NdjsonWriter, ParquetWriter, export_messages
+from utils.chat_store import append_messages, ensure_indexes
+from utils.encryption import encrypt_message
+
+START = datetime(2026, 1, 1)
+JOB = {'export': 'messages', 'format': 'test', 'user_ids': []}
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.chat_messages
+    ensure_indexes(collection)
+    user_id = ObjectId()
+    for i in range(0, 20, 2):
+        append_messages(collection, user_id, [
+            {'role': role, 'content': encrypt_message(f'm{i + j}'), 'timestamp': START + timedelta(minutes=i)}
+            for j, role in enumerate(('user', 'assistant'))
+        ])
+    return collection
+
+def crash_after(monkeypatch, batches):
+    """Make the export die like a killed process once `batches` batches were written"""
+    real_decrypt = export_history.decrypt_rows
+    calls = []
+
+    def decrypt_rows(rows):
+        calls.append(rows)
+        if len(calls) > batches:
+            raise KeyboardInterrupt
+        return real_decrypt(rows)
+
+    monkeypatch.setattr(export_history, 'decrypt_rows', decrypt_rows)
+
+def run(collection, writer_factory, checkpoint_path):
+    checkpoint = Checkpoint(checkpoint_path, JOB)
+    writer = writer_factory(checkpoint)
+    try:
+        export_messages(collection, writer, checkpoint, [], batch_size=3)
+    finally:
+        writer.close()
+
+def test_ndjson_resume_has_no_gaps_or_duplicates(collection, tmp_path, monkeypatch):
+    output = tmp_path / 'export.ndjson'
+    checkpoint_path = str(tmp_path / 'export.checkpoint.json')
+    writer_factory = lambda checkpoint: NdjsonWriter(str(output), checkpoint.state['offset'])
+
+    with monkeypatch.context() as patch:
+        crash_after(patch, 2)
+        with pytest.raises(KeyboardInterrupt):
+            run(collection, writer_factory, checkpoint_path)
+    run(collection, writer_factory, checkpoint_path)
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row['content'] for row in rows] == [f'm{i}' for i in range(20)]
+
+def test_parquet_resume_has_no_gaps_or_duplicates(collection, tmp_path, monkeypatch):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    directory = tmp_path / 'export'
+    checkpoint_path = str(tmp_path / 'export.checkpoint.json')
+    writer_factory = lambda checkpoint: ParquetWriter(str(directory), export_history._message_schema(),
+                                                      checkpoint.state['offset'], rows_per_file=6)
+
+    with monkeypatch.context() as patch:
+        # Two parts finished, the third half-written when the process dies
+        crash_after(patch, 5)
+        with pytest.raises(KeyboardInterrupt):
+            run(collection, writer_factory, checkpoint_path)
+    assert Checkpoint(checkpoint_path, JOB).state['offset'] == 2
+    run(collection, writer_factory, checkpoint_path)
+
+    parts = sorted(os.listdir(directory))
+    assert parts == [f'part-{i:05d}.parquet' for i in range(4)]
+    contents = [c for part in parts for c in parquet.read_table(directory / part)['content'].to_pylist()]
+    assert contents == [f'm{i}' for i in range(20)]
+    assert Checkpoint(checkpoint_path, JOB).state['rows'] == 20
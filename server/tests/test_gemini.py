@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from config import Config
+from utils import gemini
+
+def test_retries_transient_errors_then_succeeds(gemini_stub):
+    gemini_stub.respond(503, 429)
+
+    assert gemini.get_gemini_response('hello') == "I'm here with you."
+    assert gemini_stub.requests == 3
+    assert not gemini.breaker.is_open
+
+def test_open_circuit_returns_fallback_without_calling_upstream(gemini_stub, monkeypatch):
+    monkeypatch.setattr(Config, 'GEMINI_MAX_RETRIES', 0)
+    gemini_stub.respond(503, 503)
+
+    assert gemini.get_gemini_response('one') == gemini.REQUEST_ERROR_RESPONSE
+    assert gemini.get_gemini_response('two') == gemini.REQUEST_ERROR_RESPONSE
+    assert gemini.breaker.is_open
+
+    requests_before = gemini_stub.requests
+    assert gemini.get_gemini_response('three') == gemini.REQUEST_ERROR_RESPONSE
+    assert gemini_stub.requests == requests_before
+
+def test_client_error_probe_closes_the_circuit(gemini_stub, monkeypatch):
+    monkeypatch.setattr(Config, 'GEMINI_MAX_RETRIES', 0)
+    gemini_stub.respond(503, 503, 400)
+    gemini.get_gemini_response('one')
+    gemini.get_gemini_response('two')
+    assert gemini.breaker.is_open
+
+    time.sleep(gemini.breaker.cooldown)
+    # A 400 is our fault; the upstream answered, so the circuit closes
+    assert gemini.get_gemini_response('probe') == gemini.REQUEST_ERROR_RESPONSE
+    assert not gemini.breaker.is_open
+    assert gemini.get_gemini_response('after') == "I'm here with you."
+
+def test_probe_that_raises_unexpectedly_is_released(gemini_stub, monkeypatch):
+    monkeypatch.setattr(Config, 'GEMINI_MAX_RETRIES', 0)
+    gemini_stub.respond(503, 503)
+    gemini.get_gemini_response('one')
+    gemini.get_gemini_response('two')
+    time.sleep(gemini.breaker.cooldown)
+
+    def explode(*args, **kwargs):
+        raise ValueError("not a network error")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(gemini.get_session(), 'post', explode)
+        assert gemini.get_gemini_response('probe') == gemini.GENERIC_ERROR_RESPONSE
+
+    # The failed probe must not keep the circuit waiting on it forever
+    assert gemini.get_gemini_response('after') == "I'm here with you."
+    assert not gemini.breaker.is_open
+
+@pytest.mark.parametrize('failures', [1, 2])
+def test_half_open_probe_failure_reopens(gemini_stub, monkeypatch, failures):
+    monkeypatch.setattr(Config, 'GEMINI_MAX_RETRIES', 0)
+    gemini_stub.respond(*[503] * (2 + failures))
+    gemini.get_gemini_response('one')
+    gemini.get_gemini_response('two')
+
+    for _ in range(failures):
+        time.sleep(gemini.breaker.cooldown)
+        assert gemini.get_gemini_response('probe') == gemini.REQUEST_ERROR_RESPONSE
+        assert gemini.breaker.is_open
+
+    time.sleep(gemini.breaker.cooldown)
+    assert gemini.get_gemini_response('recovered') == "I'm here with you."
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from conftest import register
+from services.chat_turn import messages_collection
+from utils.chat_store import append_messages
+from utils.encryption import encrypt_message
+
+START = datetime(2026, 1, 1)
+
+def store_messages(user_id, count):
+    for i in range(count):
+        append_messages(messages_collection, ObjectId(user_id), [{
+            'role': 'user', 'content': encrypt_message(f'm{i}'), 'timestamp': START + timedelta(hours=i)
+        }])
+
+def test_timestamps_and_cursors_are_explicit_utc(client):
+    user_id, headers = register(client)
+    store_messages(user_id, 3)
+
+    body = client.get('/api/chat/history', headers=headers).get_json()
+    assert [m['timestamp'] for m in body['messages']] == [
+        '2026-01-01T00:00:00Z', '2026-01-01T01:00:00Z', '2026-01-01T02:00:00Z'
+    ]
+    assert body['before'] == '2026-01-01T00:00:00Z'
+    assert body['after'] == '2026-01-01T02:00:00Z'
+
+def test_cursors_round_trip(client):
+    user_id, headers = register(client)
+    store_messages(user_id, 5)
+
+    first = client.get('/api/chat/history?limit=2', headers=headers).get_json()
+    assert [m['content'] for m in first['messages']] == ['m3', 'm4']
+    older = client.get('/api/chat/history', query_string={'limit': 2, 'before': first['before']},
+                       headers=headers).get_json()
+    assert [m['content'] for m in older['messages']] == ['m1', 'm2']
+    newer = client.get('/api/chat/history', query_string={'after': older['after']}, headers=headers).get_json()
+    assert [m['content'] for m in newer['messages']] == ['m3', 'm4']
+
+def test_offset_cursors_are_normalized_to_utc(client):
+    user_id, headers = register(client)
+    store_messages(user_id, 3)
+
+    for after in ('2026-01-01T00:00:00Z', '2026-01-01T00:00:00+00:00', '2026-01-01T01:00:00+01:00',
+                  '2026-01-01T00:00:00'):
+        response = client.get('/api/chat/history', query_string={'after': after}, headers=headers)
+        assert response.status_code == 200, after
+        assert [m['content'] for m in response.get_json()['messages']] == ['m1', 'm2']
+
+def test_invalid_cursor_is_rejected(client):
+    _, headers = register(client)
+    response = client.get('/api/chat/history?before=yesterday', headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from conftest import register
+from utils.rate_limit import AdmissionController, InMemoryRateLimitStore, RateLimitExceeded, user_limiter
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Two messages in a burst, then one every ten seconds"""
+    monkeypatch.setattr(user_limiter, 'store', InMemoryRateLimitStore())
+    monkeypatch.setattr(user_limiter, 'rate', 6 / 60.0)
+    monkeypatch.setattr(user_limiter, 'burst', 2)
+    monkeypatch.setattr(user_limiter, 'enabled', True)
+    return user_limiter
+
+def send(client, headers, message='hello'):
+    return client.post('/api/chat/send', json={'message': message}, headers=headers)
+
+def test_burst_then_429(client, gemini_stub, limiter):
+    _, headers = register(client)
+    assert [send(client, headers).status_code for _ in range(3)] == [200, 200, 429]
+    assert gemini_stub.requests == 2
+
+def test_429_says_when_to_retry(client, gemini_stub, limiter):
+    _, headers = register(client)
+    send(client, headers)
+    send(client, headers)
+
+    response = send(client, headers)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '10'
+
+def test_limits_are_per_user(client, gemini_stub, limiter):
+    _, first = register(client, 'first@example.com')
+    _, second = register(client, 'second@example.com')
+    for _ in range(2):
+        send(client, first)
+
+    assert send(client, first).status_code == 429
+    assert send(client, second).status_code == 200
+
+def test_crisis_message_is_answered_while_limited(client, gemini_stub, limiter):
+    from services.chat_turn import CRISIS_RESPONSE
+    _, headers = register(client)
+    for _ in range(2):
+        send(client, headers)
+    assert send(client, headers).status_code == 429
+
+    response = send(client, headers, 'I feel suicidal')
+    assert response.status_code == 200
+    assert response.get_json()['response'] == CRISIS_RESPONSE
+
+    stream = client.post('/api/chat/send/stream', json={'message': 'I feel suicidal'}, headers=headers)
+    assert stream.status_code == 200
+    assert 'National Suicide Prevention Lifeline' in stream.get_data(as_text=True)
+
+def test_admission_times_out_when_every_slot_is_taken():
+    admission = AdmissionController(max_in_flight=1, timeout=0.05)
+    admission.acquire()
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        admission.acquire()
+    assert excinfo.value.retry_after >= 1
+
+    admission.release()
+    with admission:
+        pass
+
+def test_admission_waits_for_a_slot_to_free_up():
+    admission = AdmissionController(max_in_flight=1, timeout=1)
+    admission.acquire()
+    threading.Timer(0.05, admission.release).start()
+    with admission:
+        pass
+
+def test_async_routes_have_their_own_gemini_slots():
+    from config import Config
+    from utils.rate_limit import gemini_admission, gemini_async_admission
+    # The async client isn't bound to a thread per call; its cap follows its own pool
+    assert gemini_async_admission is not gemini_admission
+    assert gemini_async_admission.max_in_flight == Config.GEMINI_ASYNC_POOL_SIZE
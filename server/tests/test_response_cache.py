@@ -0,0 +1,69 @@
+import pytest
+
+from config import Config
+from conftest import register
+from utils import gemini
+from utils.response_cache import ResponseCache
+
+GENERATION = {'temperature': 0.7}
+
+@pytest.fixture
+def cache(monkeypatch):
+    """An enabled cache with the configured defaults, installed where utils.gemini looks"""
+    cache = ResponseCache(max_entries=100, ttl=60, similarity=Config.RESPONSE_CACHE_SIMILARITY)
+    monkeypatch.setattr(gemini, 'response_cache', cache)
+    return cache
+
+def test_exact_repeat_is_a_hit(cache):
+    cache.put('Hello, Eve!', GENERATION, 'Hi there.')
+    assert cache.get('hello eve', GENERATION) == 'Hi there.'
+
+@pytest.mark.parametrize('cached, asked', [
+    ('I am happy with my life', 'I am not happy with my life'),
+    ('my father passed away', 'my mother passed away'),
+])
+def test_near_miss_is_rejected_by_default(cache, cached, asked):
+    cache.put(cached, GENERATION, 'reply written for the other message')
+    assert cache.get(asked, GENERATION) is None
+
+def test_fuzzy_matching_is_opt_in():
+    cache = ResponseCache(max_entries=100, ttl=60, similarity=0.85)
+    cache.put('I have been feeling so tired lately', GENERATION, 'Tell me more.')
+    # A typo is close enough once an operator opts in
+    assert cache.get('I have been feelin so tired lately', GENERATION) == 'Tell me more.'
+    assert cache.near_hits == 1
+
+def test_replies_with_history_are_never_shared(cache, gemini_stub):
+    history = [{'role': 'user', 'parts': ['my sister is ill']}, {'role': 'model', 'parts': ['I am sorry.']}]
+    gemini.get_gemini_response('how are you?', history)
+    assert cache.stats()['entries'] == 0
+
+    gemini.get_gemini_response('how are you?')
+    requests = gemini_stub.requests
+    # Another user's follow-up to their own history still goes upstream
+    gemini.get_gemini_response('how are you?', history)
+    assert gemini_stub.requests == requests + 1
+
+def test_cache_never_crosses_users(client, cache, gemini_stub):
+    _, first = register(client, 'first@example.com')
+    _, second = register(client, 'second@example.com')
+    client.post('/api/chat/send', json={'message': 'I had a hard day'}, headers=first)
+    client.post('/api/chat/send', json={'message': 'work is stressful'}, headers=second)
+    requests = gemini_stub.requests
+
+    # The second user's history now differs, so the first user's message is answered fresh
+    client.post('/api/chat/send', json={'message': 'I had a hard day'}, headers=second)
+    assert gemini_stub.requests == requests + 1
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_crisis_prompts_are_never_cached(cache, gemini_stub, stream):
+    message = 'I want to end my life'
+    if stream:
+        list(gemini.stream_gemini_response(message))
+    else:
+        gemini.get_gemini_response(message)
+    assert cache.stats()['entries'] == 0
+
+    # Nor served from the cache if a reply was stored before the phrase was added
+    cache.put(message, gemini._build_payload(message)['generationConfig'], 'stale reply')
+    assert gemini.get_gemini_response(message) != 'stale reply'
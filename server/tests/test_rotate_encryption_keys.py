@@ -0,0 +1,130 @@
+from datetime import datetime
+
+import mongomock
+import pytest
+from bson import ObjectId
+from cryptography.fernet import Fernet
+from pymongo.errors import AutoReconnect
+
+from config import Config
+from scripts.rotate_encryption_keys import rotate
+from utils import encryption
+from utils.encryption import decrypt_message, encrypt_message
+
+OLD_KEY = Fernet.generate_key().decode()
+NEW_KEY = Fernet.generate_key().decode()
+
+class RecordingCollection:
+    """
+    mongomock collection whose bulk_write applies updates one at a time and records them
+
+    `fail_on` makes that bulk_write call (1-based) lose the connection before
+    writing anything, like the job being interrupted between batches.
+    """
+    def __init__(self, collection):
+        self.collection = collection
+        self.updated = []
+        self.calls = 0
+        self.fail_on = None
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise AutoReconnect('connection reset by peer')
+        for op in operations:
+            self.collection.update_one(op._filter, op._doc)
+            self.updated.append(op._filter['_id'])
+
+def use_keys(monkeypatch, *keys):
+    """Configure ENCRYPTION_KEYS, newest first, and drop the cached keyring"""
+    monkeypatch.setattr(encryption, 'ENCRYPTION_KEY', None)
+    monkeypatch.setattr(encryption, 'ENCRYPTION_KEYS', list(keys))
+    monkeypatch.setattr(encryption, '_keyring', None)
+    monkeypatch.setattr(encryption, '_keyring_keys', None)
+
+@pytest.fixture
+def db(monkeypatch):
+    # Every decryption below must really use the keys
+    monkeypatch.setattr(encryption.decrypt_cache, 'enabled', False)
+    use_keys(monkeypatch, OLD_KEY)
+    client = mongomock.MongoClient()
+    db = {
+        'chat_messages': RecordingCollection(client.db.chat_messages),
+        'chats': RecordingCollection(client.db.chats),
+        'maintenance': client.db.maintenance
+    }
+    for i in range(5):
+        # Buckets written before and after the binary envelope was introduced
+        monkeypatch.setattr(Config, 'MESSAGE_ENVELOPE', 'legacy' if i % 2 else 'binary')
+        db['chat_messages'].insert_one({'user_id': ObjectId(), 'messages': [
+            {'role': 'user', 'content': encrypt_message(f'bucket {i} message {j}'), 'timestamp': datetime(2026, 1, 1)}
+            for j in range(3)
+        ]})
+        db['chats'].insert_one({'user_id': ObjectId(), 'summary': encrypt_message(f'summary {i}')})
+    db['chats'].insert_one({'user_id': ObjectId()})
+    return db
+
+def contents(db):
+    messages = [m['content'] for bucket in db['chat_messages'].find().sort('_id', 1) for m in bucket['messages']]
+    summaries = [chat['summary'] for chat in db['chats'].find().sort('_id', 1) if 'summary' in chat]
+    return messages, summaries
+
+def plaintexts(db):
+    messages, summaries = contents(db)
+    return [decrypt_message(m) for m in messages], [decrypt_message(s) for s in summaries]
+
+def test_old_data_decrypts_with_the_new_key_added(db, monkeypatch):
+    expected = plaintexts(db)
+    use_keys(monkeypatch, NEW_KEY, OLD_KEY)
+
+    assert plaintexts(db) == expected
+    assert encryption.primary_key_id() == encryption.key_id(NEW_KEY)
+    # New writes use the new key
+    sealed = encrypt_message('fresh')
+    use_keys(monkeypatch, NEW_KEY)
+    assert decrypt_message(sealed) == 'fresh'
+
+def test_rotated_data_decrypts_without_the_old_key(db, monkeypatch):
+    expected = plaintexts(db)
+    messages, summaries = contents(db)
+    use_keys(monkeypatch, NEW_KEY, OLD_KEY)
+
+    checkpoint = rotate(db, batch_size=2, max_per_second=0)
+    assert checkpoint['phase'] == 'done'
+    assert checkpoint['rotated'] == 10
+
+    use_keys(monkeypatch, NEW_KEY)
+    assert plaintexts(db) == expected
+    # Legacy strings stay strings and envelopes stay binary
+    rotated_messages, rotated_summaries = contents(db)
+    assert [type(m) for m in rotated_messages] == [type(m) for m in messages]
+    assert [type(s) for s in rotated_summaries] == [type(s) for s in summaries]
+    assert rotated_messages != messages
+
+def test_resumed_job_neither_skips_nor_repeats(db, monkeypatch):
+    expected = plaintexts(db)
+    use_keys(monkeypatch, NEW_KEY, OLD_KEY)
+
+    # Interrupted in the second batch of buckets, then in the second batch of summaries
+    db['chat_messages'].fail_on = 2
+    with pytest.raises(AutoReconnect):
+        rotate(db, batch_size=2, max_per_second=0)
+    db['chats'].fail_on = 2
+    with pytest.raises(AutoReconnect):
+        rotate(db, batch_size=2, max_per_second=0)
+    checkpoint = rotate(db, batch_size=2, max_per_second=0)
+
+    assert checkpoint['phase'] == 'done'
+    buckets = [bucket['_id'] for bucket in db['chat_messages'].find().sort('_id', 1)]
+    chats = [chat['_id'] for chat in db['chats'].find({'summary': {'$exists': True}}).sort('_id', 1)]
+    assert db['chat_messages'].updated == buckets
+    assert db['chats'].updated == chats
+    assert checkpoint['rotated'] == len(buckets) + len(chats)
+
+    use_keys(monkeypatch, NEW_KEY)
+    assert plaintexts(db) == expected
+    # A finished job has nothing left to do
+    assert rotate(db, batch_size=2, max_per_second=0)['rotated'] == checkpoint['rotated']
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from conftest import register
+from services import chat_turn
+from utils import gemini
+from utils.rate_limit import AdmissionController
+
+def events(body):
+    """Parse an SSE body into (event, data) pairs"""
+    parsed = []
+    for frame in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in frame.split('\n'))
+        parsed.append((fields.get('event', 'message'), json.loads(fields['data'])))
+    return parsed
+
+def stream(client, headers, message='hello', **kwargs):
+    return client.post('/api/chat/send/stream', json={'message': message}, headers=headers, **kwargs)
+
+def history(client, headers):
+    return [m['content'] for m in client.get('/api/chat/history', headers=headers).get_json()['messages']]
+
+@pytest.fixture
+def admission(monkeypatch):
+    """A single Gemini slot that fails fast, so a leaked slot shows up as a 429"""
+    admission = AdmissionController(max_in_flight=1, timeout=0)
+    monkeypatch.setattr(chat_turn, 'gemini_admission', admission)
+    return admission
+
+def assert_slot_free(admission):
+    admission.acquire()
+    admission.release()
+
+def test_gemini_chunks_are_yielded_in_order(gemini_stub):
+    gemini_stub.stream("Eve: Tell me ", "more about ", "that.")
+    assert list(gemini.stream_gemini_response('hello')) == ["Tell me ", "more about ", "that."]
+
+def test_deltas_arrive_in_order_then_done(client, gemini_stub, admission):
+    _, headers = register(client)
+    gemini_stub.stream("Eve: Tell me ", "more about ", "that.")
+
+    response = stream(client, headers)
+    assert response.mimetype == 'text/event-stream'
+    received = events(response.get_data(as_text=True))
+    assert received[:-1] == [('message', {'delta': d}) for d in ("Tell me ", "more about ", "that.")]
+    assert received[-1] == ('done', {'message': 'Message sent successfully!', 'response': "Tell me more about that."})
+    assert history(client, headers) == ['hello', "Tell me more about that."]
+    assert_slot_free(admission)
+
+def test_failure_part_way_is_an_error_and_persists_nothing(client, gemini_stub, admission):
+    _, headers = register(client)
+    gemini_stub.stream("Eve: Part ", "of a ", "reply", fail_after=2)
+
+    with pytest.raises(gemini.StreamInterruptedError):
+        list(chat_turn.stream_chat_turn(register(client, 'direct@example.com')[0], 'hello'))
+
+    gemini_stub.stream("Eve: Part ", "of a ", "reply", fail_after=2)
+    received = events(stream(client, headers).get_data(as_text=True))
+    assert received[:2] == [('message', {'delta': "Part "}), ('message', {'delta': "of a "})]
+    assert received[-1] == ('error', {'message': 'The reply was interrupted, please try again.'})
+    assert history(client, headers) == []
+    assert_slot_free(admission)
+
+def test_client_disconnect_releases_the_slot(client, gemini_stub, admission):
+    _, headers = register(client)
+    gemini_stub.stream("Eve: One ", "two ", "three.")
+
+    response = stream(client, headers, buffered=False)
+    assert next(iter(response.response))
+    # The client goes away after the first delta
+    response.close()
+
+    assert_slot_free(admission)
+    assert history(client, headers) == []
+
+def test_no_slot_is_a_429_before_streaming(client, gemini_stub, admission):
+    _, headers = register(client)
+    admission.acquire()
+    try:
+        response = stream(client, headers)
+    finally:
+        admission.release()
+    assert response.status_code == 429
+    assert gemini_stub.requests == 0
@@ -0,0 +1,116 @@
+import time
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+from config import Config
+from utils import summarizer as summarizer_module
+from utils.chat_store import append_messages, ensure_indexes, get_recent_messages
+from utils.encryption import decrypt_message, encrypt_message
+from services.chat_turn import build_turn_messages
+from utils.summarizer import ConversationSummarizer
+
+START = datetime(2026, 1, 1)
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().db
+    ensure_indexes(db.chat_messages)
+    return db
+
+@pytest.fixture
+def prompts(monkeypatch):
+    prompts = []
+
+    def generate_text(prompt, **kwargs):
+        prompts.append(prompt)
+        return "The client has been talking about work."
+
+    monkeypatch.setattr(summarizer_module, 'generate_text', generate_text)
+    return prompts
+
+def store(db, user_id, texts, start=0):
+    for i, text in enumerate(texts, start):
+        append_messages(db.chat_messages, user_id, [{
+            'role': 'user' if i % 2 == 0 else 'assistant',
+            'content': encrypt_message(text),
+            'timestamp': START + timedelta(minutes=i)
+        }])
+
+def test_summarizes_everything_not_included_verbatim(db, prompts, monkeypatch):
+    monkeypatch.setattr(Config, 'PROMPT_HISTORY_TOKEN_BUDGET', 1000)
+    user_id = ObjectId()
+    # ~300 tokens each: only the newest three fit in the prompt's history budget
+    texts = [f"message {i} " + "word " * 240 for i in range(12)]
+    store(db, user_id, texts)
+    summarizer = ConversationSummarizer(db.chats, db.chat_messages, window_messages=10)
+
+    # Three fit, but the oldest of those is a reply whose message didn't
+    verbatim = summarizer.verbatim(get_recent_messages(db.chat_messages, user_id, 10))
+    assert [m['role'] for m in verbatim] == ['user', 'assistant']
+
+    assert summarizer.refresh(str(user_id))
+    for i in range(10):
+        assert f"message {i} " in prompts[0]
+    for i in range(10, 12):
+        assert f"message {i} " not in prompts[0]
+    chat = db.chats.find_one({'user_id': user_id})
+    assert chat['summary_through'] == START + timedelta(minutes=9)
+
+def test_refresh_only_summarizes_new_messages(db, prompts):
+    user_id = ObjectId()
+    store(db, user_id, [f"short {i}" for i in range(14)])
+    summarizer = ConversationSummarizer(db.chats, db.chat_messages, window_messages=10)
+
+    assert summarizer.refresh(str(user_id))
+    assert "short 3" in prompts[0] and "short 4" not in prompts[0]
+    # Nothing has left the verbatim window since
+    assert not summarizer.refresh(str(user_id))
+    assert len(prompts) == 1
+
+def test_turns_sharing_a_timestamp_are_never_split(db, prompts, monkeypatch):
+    monkeypatch.setattr(Config, 'PROMPT_HISTORY_TOKEN_BUDGET', 1000)
+    user_id = ObjectId()
+    summarizer = ConversationSummarizer(db.chats, db.chat_messages, window_messages=10)
+
+    def turn(i):
+        # Real turns are a Gemini round trip apart; BSON dates only keep milliseconds
+        time.sleep(0.002)
+        # Both sides of a turn carry the same timestamp; ~300 tokens each
+        append_messages(db.chat_messages, user_id,
+                        build_turn_messages(f"U{i} " + "word " * 240, f"A{i} " + "word " * 240))
+
+    for i in range(12):
+        turn(i)
+    assert summarizer.refresh(str(user_id))
+    for i in range(12, 16):
+        turn(i)
+    assert summarizer.refresh(str(user_id))
+
+    # Every message is either folded into the summary or still in the prompt, never neither
+    summarized = " ".join(prompts)
+    verbatim = summarizer.verbatim(get_recent_messages(db.chat_messages, user_id, 10))
+    in_prompt = {decrypt_message(m['content']).split()[0] for m in verbatim}
+    for i in range(16):
+        for side in (f"U{i}", f"A{i}"):
+            assert (f"{side} " in summarized) != (side in in_prompt), side
+
+def test_workers_see_each_others_summaries(db, prompts, monkeypatch):
+    user_id = ObjectId()
+    store(db, user_id, [f"short {i}" for i in range(14)])
+    worker_a = ConversationSummarizer(db.chats, db.chat_messages, window_messages=10)
+    worker_b = ConversationSummarizer(db.chats, db.chat_messages, window_messages=10)
+    assert worker_a.summary_turns(str(user_id)) == []
+
+    assert worker_a.refresh(str(user_id))
+    assert worker_a.summary_turns(str(user_id))[0]['parts'] == ["The client has been talking about work."]
+
+    # Worker B folds in messages that have since left the verbatim window
+    store(db, user_id, [f"later {i}" for i in range(14, 18)], start=14)
+    monkeypatch.setattr(summarizer_module, 'generate_text', lambda prompt, **kwargs: "Now about family.")
+    assert worker_b.refresh(str(user_id))
+
+    # Worker A's cached summary no longer covers them
+    assert worker_a.summary_turns(str(user_id))[0]['parts'] == ["Now about family."]
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError
+
+from utils import chat_store, write_behind
+from utils.chat_store import ensure_indexes, iter_messages
+from utils.write_behind import WriteBehindQueue
+
+START = datetime(2026, 1, 1)
+
+class FlakyCollection:
+    """
+    mongomock collection whose bulk_write applies ops one at a time
+
+    `drop_after` makes the next bulk_write apply that many operations and
+    then lose the connection, like a primary stepping down mid-batch.
+    """
+    def __init__(self, collection):
+        self.collection = collection
+        self.drop_after = None
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, operations, ordered=True):
+        for i, op in enumerate(operations):
+            if i == self.drop_after:
+                self.drop_after = None
+                raise AutoReconnect('connection reset by peer')
+            try:
+                self.collection.update_one(op._filter, op._doc, upsert=op._upsert)
+            except DuplicateKeyError as e:
+                raise BulkWriteError({'writeErrors': [{'index': i, 'code': 11000, 'errmsg': str(e)}]})
+
+@pytest.fixture
+def collection(monkeypatch):
+    monkeypatch.setattr(chat_store, 'BUCKET_SIZE', 6)
+    monkeypatch.setattr(write_behind, 'BUCKET_SIZE', 6)
+    collection = mongomock.MongoClient().db.chat_messages
+    ensure_indexes(collection)
+    return FlakyCollection(collection)
+
+def turn(i):
+    timestamp = START + timedelta(minutes=i)
+    return [{'role': 'user', 'content': f'u{i}', 'timestamp': timestamp},
+            {'role': 'assistant', 'content': f'a{i}', 'timestamp': timestamp}]
+
+def contents(collection, user_id):
+    return [m['content'] for m in iter_messages(collection, user_id)]
+
+def test_batch_is_written_in_order_across_bucket_boundaries(collection):
+    user_id = ObjectId()
+    writer = WriteBehindQueue(collection, mode='async')
+    for i in range(5):
+        writer.submit(user_id, turn(i))
+    writer.close()
+
+    assert contents(collection, user_id) == [x for i in range(5) for x in (f'u{i}', f'a{i}')]
+
+def test_full_open_bucket_is_rolled_over(collection):
+    user_id = ObjectId()
+    writer = WriteBehindQueue(collection, mode='async')
+    writer.submit(user_id, turn(0))
+    writer.flush()
+    for i in range(1, 5):
+        writer.submit(user_id, turn(i))
+    writer.close()
+
+    assert contents(collection, user_id) == [x for i in range(5) for x in (f'u{i}', f'a{i}')]
+    assert collection.count_documents({'user_id': user_id, 'open': True}) == 1
+
+def test_replay_after_dropped_connection_does_not_duplicate(collection):
+    users = [ObjectId() for _ in range(3)]
+    writer = WriteBehindQueue(collection, mode='async')
+    # The first user's upsert lands, then the connection drops
+    collection.drop_after = 1
+    writer._write([(user_id, turn(i)) for i, user_id in enumerate(users)])
+
+    for i, user_id in enumerate(users):
+        assert contents(collection, user_id) == [f'u{i}', f'a{i}']
+
+def test_sync_mode_writes_immediately(collection):
+    user_id = ObjectId()
+    WriteBehindQueue(collection, mode='sync').submit(user_id, turn(0))
+    assert contents(collection, user_id) == ['u0', 'a0']
@@ -0,0 +1,198 @@
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from config import Config
+from utils.metrics import timed
+
+# Messages are stored in per-user buckets of at most BUCKET_SIZE entries:
+#   {user_id, start, timestamp, count, open, messages: [{role, content, timestamp}, ...]}
+# `start`/`timestamp` are the times of the first/last message in the bucket, so
+# the (user_id, timestamp) index walks a user's history newest bucket first.
+# Only the user's newest bucket carries `open: true`, and only it is appended
+# to; a unique partial index guarantees there is never more than one, so an
+# older bucket with room left can never receive newer messages.
+BUCKET_SIZE = Config.CHAT_BUCKET_SIZE
+
+# Attempts at closing a full bucket and opening the next before giving up
+APPEND_ATTEMPTS = 3
+
+def ensure_indexes(collection):
+    """Create the indexes the bucket queries rely on"""
+    collection.create_index([('user_id', ASCENDING), ('timestamp', DESCENDING)])
+    collection.create_index([('user_id', ASCENDING)], unique=True,
+                            partialFilterExpression={'open': True}, name='user_id_open_bucket')
+
+def build_append_update(user_id, messages):
+    """Filter and update document for appending messages to the open bucket"""
+    query = {'user_id': user_id, 'open': True, 'count': {'$lte': BUCKET_SIZE - len(messages)}}
+    update = {
+        '$push': {'messages': {'$each': messages}},
+        '$inc': {'count': len(messages)},
+        '$min': {'start': messages[0]['timestamp']},
+        '$max': {'timestamp': messages[-1]['timestamp']}
+    }
+    return query, update
+
+def build_close_update(user_id, messages):
+    """Filter and update closing the user's open bucket if these messages don't fit in it"""
+    query = {'user_id': user_id, 'open': True, 'count': {'$gt': BUCKET_SIZE - len(messages)}}
+    return query, {'$unset': {'open': ''}}
+
+def append_messages(collection, user_id, messages):
+    """
+    Append messages to the user's open bucket in a single upsert
+
+    The filter only matches the open bucket, and only when it has room for
+    every new message. When the user has no bucket yet the upsert opens one.
+    When the open bucket is full the upsert collides with it on the unique
+    index, so it is closed and the upsert retried, which opens the next one.
+    """
+    query, update = build_append_update(user_id, messages)
+    with timed('mongo_write'):
+        for attempt in range(APPEND_ATTEMPTS):
+            try:
+                collection.update_one(query, update, upsert=True)
+                return
+            except DuplicateKeyError:
+                if attempt == APPEND_ATTEMPTS - 1:
+                    raise
+                collection.update_one(*build_close_update(user_id, messages))
+
+async def append_messages_async(collection, user_id, messages):
+    """append_messages for a motor collection"""
+    query, update = build_append_update(user_id, messages)
+    with timed('mongo_write'):
+        for attempt in range(APPEND_ATTEMPTS):
+            try:
+                await collection.update_one(query, update, upsert=True)
+                return
+            except DuplicateKeyError:
+                if attempt == APPEND_ATTEMPTS - 1:
+                    raise
+                await collection.update_one(*build_close_update(user_id, messages))
+
+def _recent_cursor(collection, user_id, limit):
+    # Each bucket is projected down to its last `limit` messages, newest bucket first
+    return collection.find(
+        {'user_id': user_id},
+        {'messages': {'$slice': -limit}}
+    ).sort('timestamp', DESCENDING).limit(limit).batch_size(2)
+
+def get_recent_messages(collection, user_id, limit):
+    """
+    Return the user's last `limit` messages, oldest first
+
+    Each bucket is projected down to its last `limit` messages and buckets are
+    read newest first until enough messages have been collected, so the read
+    is bounded by `limit` no matter how long the history is.
+    """
+    if limit <= 0:
+        return []
+
+    recent = []
+    with timed('mongo_read'):
+        cursor = _recent_cursor(collection, user_id, limit)
+        for bucket in cursor:
+            needed = limit - len(recent)
+            recent = bucket.get('messages', [])[-needed:] + recent
+            if len(recent) >= limit:
+                break
+        cursor.close()
+
+    return recent
+
+async def get_recent_messages_async(collection, user_id, limit):
+    """get_recent_messages for a motor collection"""
+    if limit <= 0:
+        return []
+
+    recent = []
+    with timed('mongo_read'):
+        cursor = _recent_cursor(collection, user_id, limit)
+        async for bucket in cursor:
+            needed = limit - len(recent)
+            recent = bucket.get('messages', [])[-needed:] + recent
+            if len(recent) >= limit:
+                break
+        await cursor.close()
+
+    return recent
+
+def iter_messages(collection, user_id):
+    """Yield every message the user has stored, oldest first"""
+    for bucket in collection.find({'user_id': user_id}).sort('timestamp', ASCENDING):
+        for message in bucket.get('messages', []):
+            yield message
+
+def get_messages_page(collection, user_id, limit, before=None, after=None):
+    """
+    Return one page of the user's messages, oldest first, and whether more exist
+
+    Without `after` the page holds the newest `limit` messages older than
+    `before` (the whole history when `before` is None), for scrolling back.
+    With `after` it holds the oldest `limit` messages newer than `after`, for
+    catching up. Messages sharing the boundary timestamp are never split
+    across pages, so a page can run slightly over `limit`.
+    """
+    query = {'user_id': user_id}
+    if before is not None:
+        query['start'] = {'$lt': before}
+    if after is not None:
+        query['timestamp'] = {'$gt': after}
+
+    def in_range(message):
+        return ((before is None or message['timestamp'] < before) and
+                (after is None or message['timestamp'] > after))
+
+    # Walk away from the cursor: newest first when paging back, oldest first when catching up
+    newest_first = after is None
+    cursor = collection.find(query, {'messages': 1}).sort(
+        'timestamp', DESCENDING if newest_first else ASCENDING
+    ).batch_size(2)
+
+    page = []
+    has_more = False
+    with timed('mongo_read'):
+        for bucket in cursor:
+            messages = [m for m in bucket.get('messages', []) if in_range(m)]
+            for message in (reversed(messages) if newest_first else messages):
+                if len(page) >= limit and message['timestamp'] != page[-1]['timestamp']:
+                    has_more = True
+                    break
+                page.append(message)
+            if has_more:
+                break
+        cursor.close()
+
+    if newest_first:
+        page.reverse()
+    return page, has_more
+
+def get_history_version(collection, user_id):
+    """Return a cheap marker that changes whenever the user's history does"""
+    with timed('mongo_read'):
+        bucket = collection.find_one(
+            {'user_id': user_id},
+            {'count': 1},
+            sort=[('timestamp', DESCENDING)]
+        )
+    if not bucket:
+        return None
+    return f"{bucket['_id']}:{bucket['count']}"
+
+def _latest_query(user_id):
+    # Covered by the (user_id, timestamp) index: no bucket is fetched
+    return ({'user_id': user_id}, {'_id': 0, 'timestamp': 1}), {'sort': [('timestamp', DESCENDING)]}
+
+def get_latest_timestamp(collection, user_id):
+    """Return the time of the user's newest stored message, or None"""
+    args, kwargs = _latest_query(user_id)
+    with timed('mongo_read'):
+        bucket = collection.find_one(*args, **kwargs)
+    return bucket['timestamp'] if bucket else None
+
+async def get_latest_timestamp_async(collection, user_id):
+    """get_latest_timestamp for a motor collection"""
+    args, kwargs = _latest_query(user_id)
+    with timed('mongo_read'):
+        bucket = await collection.find_one(*args, **kwargs)
+    return bucket['timestamp'] if bucket else None
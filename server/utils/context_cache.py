@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import Config
+
+# Conversation context is cached as the list Gemini consumes:
+#   [{"role": "user" | "model", "parts": [text]}, ...]  (oldest first)
+# Backends store entries of the form {"turns": [...], "through": iso timestamp or None}.
+
+class InMemoryContextBackend:
+    """Process-local backend with LRU eviction and per-entry expiry"""
+    def __init__(self, max_users, ttl):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            entry, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def set(self, user_id, entry):
+        with self._lock:
+            self._entries[user_id] = (entry, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+class RedisContextBackend:
+    """
+    Shared backend for any client exposing redis-py's get/set/delete
+
+    Entries are JSON-encoded and expire server-side after `ttl` seconds.
+    """
+    def __init__(self, client, ttl, prefix='eve:context:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, user_id):
+        raw = self.client.get(self.prefix + user_id)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def set(self, user_id, entry):
+        self.client.set(self.prefix + user_id, json.dumps(entry), ex=int(self.ttl))
+
+    def delete(self, user_id):
+        self.client.delete(self.prefix + user_id)
+
+class ContextCache:
+    """
+    Per-user cache of the most recent decrypted conversation turns
+
+    Reads return None on a miss so the caller can rebuild the context from
+    MongoDB. Writes are write-through: once a turn has been persisted it is
+    appended to the cached context, trimmed to `max_messages`. Users that are
+    not cached are left alone and get loaded on their next miss.
+
+    Each entry remembers `through`, the timestamp of the newest message it
+    covers. Another worker (or another process with its own in-memory cache)
+    may have persisted turns since, so callers pass `latest`, the newest
+    timestamp in MongoDB, and an entry that ends before it counts as a miss.
+    Two turns for the same user racing on different workers can still leave
+    one out of the other's entry until it expires or the user's next turn
+    lands elsewhere.
+    """
+    def __init__(self, backend, max_messages, enabled=True):
+        self.backend = backend
+        self.max_messages = max_messages
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, latest=None):
+        if not self.enabled:
+            return None
+        entry = self.backend.get(user_id)
+        if entry is not None and latest is not None and not self._covers(entry, latest):
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(entry['turns'])
+
+    def set(self, user_id, turns, through=None):
+        if self.enabled:
+            self.backend.set(user_id, self._entry(turns[-self.max_messages:], through))
+
+    def append(self, user_id, turns, through=None):
+        if not self.enabled:
+            return
+        entry = self.backend.get(user_id)
+        if entry is not None:
+            self.backend.set(user_id, self._entry((entry['turns'] + turns)[-self.max_messages:], through))
+
+    def invalidate(self, user_id):
+        if self.enabled:
+            self.backend.delete(user_id)
+
+    @staticmethod
+    def _entry(turns, through):
+        return {'turns': list(turns), 'through': through.isoformat() if through else None}
+
+    @staticmethod
+    def _covers(entry, latest):
+        return entry['through'] is not None and datetime.fromisoformat(entry['through']) >= latest
+
+def create_context_cache(max_messages, namespace='context'):
+    """Build the context cache selected by CONTEXT_CACHE_BACKEND"""
+    if Config.CONTEXT_CACHE_BACKEND == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CONTEXT_CACHE_BACKEND=redis requires the redis package")
+        backend = RedisContextBackend(redis.Redis.from_url(Config.REDIS_URL), Config.CONTEXT_CACHE_TTL,
+                                      prefix=f'eve:{namespace}:')
+    else:
+        backend = InMemoryContextBackend(Config.CONTEXT_CACHE_MAX_USERS, Config.CONTEXT_CACHE_TTL)
+    return ContextCache(backend, max_messages, enabled=Config.CONTEXT_CACHE_ENABLED)
@@ -0,0 +1,112 @@
+import logging
+import re
+import unicodedata
+from collections import deque
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Common character substitutions folded back to letters before matching
+_LEET = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's'})
+_APOSTROPHES = re.compile(r"['’‘`]")
+# Scripts written without spaces between words; each character is its own token
+_UNSPACED = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+# Runs of letters in any script, or a single character from an unspaced script
+_WORD = re.compile(rf'[{_UNSPACED}]|[^\W\d_{_UNSPACED}]+')
+_REPEATS = re.compile(r'(.)\1+')
+
+def tokenize(text):
+    """
+    Normalize text into match tokens
+
+    Lowercases, strips accents, drops apostrophes ("can't" -> "cant"), folds
+    digit/symbol substitutions and collapses repeated letters ("diiie" ->
+    "die"), then splits on anything that is not a letter, in any script.
+    Chinese and Japanese characters are matched one at a time, since those
+    scripts have no spaces to mark word boundaries. Phrases and messages go
+    through the same function, so matching is insensitive to all of the
+    above while still respecting word boundaries.
+    """
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = _APOSTROPHES.sub('', text).translate(_LEET)
+    return _WORD.findall(_REPEATS.sub(r'\1', text))
+
+class CrisisDetector:
+    """
+    Word-level Aho-Corasick automaton over a set of crisis phrases
+
+    The automaton is built once; a scan walks the message's tokens a single
+    time, so its cost is linear in message length however many phrases are
+    loaded.
+    """
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._match = [None]
+        self.phrase_count = 0
+        for phrase in phrases:
+            self._add(phrase)
+        self._link()
+
+    @classmethod
+    def from_file(cls, path):
+        """Load phrases from a file with one phrase per line and # comments"""
+        with open(path, encoding='utf-8') as f:
+            phrases = [line.strip() for line in f]
+        detector = cls(p for p in phrases if p and not p.startswith('#'))
+        logger.info(f"Loaded {detector.phrase_count} crisis phrases from {path}")
+        return detector
+
+    def _add(self, phrase):
+        tokens = tokenize(phrase)
+        if not tokens:
+            logger.warning(f"Crisis phrase {phrase!r} has no letters to match on; ignoring it")
+            return
+        node = 0
+        for token in tokens:
+            next_node = self._goto[node].get(token)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][token] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._match.append(None)
+            node = next_node
+        if self._match[node] is None:
+            self.phrase_count += 1
+        self._match[node] = phrase
+
+    def _link(self):
+        # Breadth-first so every fail target is finished before it is used
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for token, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                # A phrase that ends at a suffix of this path also ends here
+                if self._match[child] is None:
+                    self._match[child] = self._match[self._fail[child]]
+                pending.append(child)
+
+    def find(self, text):
+        """Return the first crisis phrase found in `text`, or None"""
+        node = 0
+        for token in tokenize(text):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            if self._match[node] is not None:
+                return self._match[node]
+        return None
+
+    def is_crisis(self, text):
+        return self.find(text) is not None
+
+detector = CrisisDetector.from_file(Config.CRISIS_PHRASES_FILE)
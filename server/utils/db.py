@@ -0,0 +1,86 @@
+import threading
+from pymongo import MongoClient
+from config import Config
+
+# One MongoClient (and so one connection pool) per process, shared by every
+# module. It is created on first use rather than at import, so a server that
+# preloads the app in its master process and then forks workers never hands a
+# live pool to a child; post-fork hooks call reset_client to be sure.
+
+DB_NAME = 'eve'
+
+_client = None
+_generation = 0
+_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(
+                    Config.MONGO_URI,
+                    maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+                    waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connect=False
+                )
+    return _client
+
+def get_db():
+    return get_client()[DB_NAME]
+
+def reset_client():
+    """
+    Forget the current client without closing it
+
+    For forked children: the inherited client's sockets belong to the parent,
+    so the child must not use or close them; the next access builds a new one.
+    """
+    global _client, _generation
+    with _lock:
+        _client = None
+        _generation += 1
+
+def close_client():
+    """Close the current client; the next access builds a new one"""
+    global _client, _generation
+    with _lock:
+        client, _client = _client, None
+        _generation += 1
+    if client is not None:
+        client.close()
+
+def ping():
+    """Round-trip to the server; raises if MongoDB is unreachable"""
+    get_client().admin.command('ping')
+
+class LazyCollection:
+    """
+    Stand-in for a pymongo Collection that resolves against the shared client
+
+    Lets modules keep `users_collection = collection('users')` at module level
+    while the client behind it is created (and recreated after a fork) lazily.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._collection = None
+        self._generation = None
+
+    def _resolve(self):
+        if self._collection is None or self._generation != _generation:
+            self._generation = _generation
+            self._collection = get_db()[self._name]
+        return self._collection
+
+    def __getattr__(self, attribute):
+        return getattr(self._resolve(), attribute)
+
+    def __repr__(self):
+        return f"LazyCollection({self._name!r})"
+
+def collection(name):
+    return LazyCollection(name)
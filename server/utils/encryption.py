@@ -1,21 +1,30 @@
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 import os
 import base64
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from config import Config
+from utils import envelope
 
 # Get encryption key from configuration
 ENCRYPTION_KEY = Config.ENCRYPTION_KEY
+ENCRYPTION_KEYS = [key.strip() for key in Config.ENCRYPTION_KEYS.split(',') if key.strip()]
 
 # Ensure encryption key is available
-if not ENCRYPTION_KEY:
+if not ENCRYPTION_KEY and not ENCRYPTION_KEYS:
     raise ValueError("Encryption key not found in configuration")
 
 # Derive a key from the password
-def get_encryption_key():
+def get_encryption_key(password=None):
+    """PBKDF2-derive a Fernet key from a password (ENCRYPTION_KEY by default); slow by design"""
     try:
-        password = ENCRYPTION_KEY.encode()
+        password = (password or ENCRYPTION_KEY).encode()
         # Use a more secure salt approach
         salt = b'static_salt_for_eve_app_security'  # Better fixed salt than derived from password
         kdf = PBKDF2HMAC(
@@ -29,14 +38,171 @@ def get_encryption_key():
     except Exception as e:
         raise ValueError(f"Failed to generate encryption key: {str(e)}")
 
-# Initialize Fernet cipher with the key
-try:
-    cipher_suite = Fernet(get_encryption_key())
-except Exception as e:
-    raise RuntimeError(f"Failed to initialize encryption: {str(e)}")
+def key_id(key):
+    """Short fingerprint identifying a key without revealing it"""
+    if isinstance(key, str):
+        key = key.encode()
+    return hashlib.sha256(key).hexdigest()[:16]
+
+_keyring = None
+_keyring_keys = None
+_keyring_lock = threading.Lock()
+
+def get_keys():
+    """Return the configured Fernet keys, newest first, deriving the password key on first use"""
+    global _keyring_keys
+    if _keyring_keys is None:
+        with _keyring_lock:
+            if _keyring_keys is None:
+                keys = [key.encode() for key in ENCRYPTION_KEYS]
+                if ENCRYPTION_KEY:
+                    derived = get_encryption_key()
+                    if derived not in keys:
+                        keys.append(derived)
+                _keyring_keys = keys
+    return _keyring_keys
+
+def get_keyring():
+    """
+    Return the MultiFernet that encrypts with the newest key and decrypts with any
+
+    Built on first use rather than at import, so the PBKDF2 derivation of
+    ENCRYPTION_KEY is paid once per process, and not at all when every key
+    is configured pre-derived in ENCRYPTION_KEYS.
+    """
+    global _keyring
+    if _keyring is None:
+        try:
+            keyring = MultiFernet([Fernet(key) for key in get_keys()])
+        except Exception as e:
+            raise RuntimeError(f"Failed to initialize encryption: {str(e)}")
+        with _keyring_lock:
+            if _keyring is None:
+                _keyring = keyring
+    return _keyring
+
+def primary_key_id():
+    """Fingerprint of the key new data is encrypted with"""
+    return key_id(get_keys()[0])
+
+def rotate_message(encrypted_message):
+    """Re-encrypt a ciphertext under the newest key, keeping its original timestamp and format"""
+    try:
+        if envelope.is_envelope(encrypted_message):
+            token, size = envelope.unpack(encrypted_message)
+            rotated = get_keyring().rotate(base64.urlsafe_b64encode(token))
+            return envelope.pack(base64.urlsafe_b64decode(rotated), size)
+        return get_keyring().rotate(encrypted_message.encode('utf-8')).decode('utf-8')
+    except InvalidToken:
+        raise ValueError("Invalid token or corrupted encrypted data")
+
+class DecryptCache:
+    """
+    Size-bounded LRU cache of decrypted plaintexts keyed by ciphertext digest
+    
+    Entries expire `ttl` seconds after they were stored so plaintext is not
+    retained in memory indefinitely. The cache evicts least recently used
+    entries once either `max_entries` or `max_bytes` is exceeded.
+    """
+    def __init__(self, max_entries, max_bytes, ttl, enabled=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(encrypted_message):
+        if isinstance(encrypted_message, str):
+            encrypted_message = encrypted_message.encode('utf-8')
+        return hashlib.sha256(encrypted_message).digest()
+    
+    @staticmethod
+    def _size(plaintext):
+        # Rough per-entry footprint: the plaintext object plus key and bookkeeping
+        return sys.getsizeof(plaintext) + 128
+    
+    def get(self, encrypted_message):
+        if not self.enabled:
+            return None
+        key = self._key(encrypted_message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            plaintext, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return plaintext
+    
+    def put(self, encrypted_message, plaintext):
+        if not self.enabled:
+            return
+        size = self._size(plaintext)
+        if size > self.max_bytes:
+            return
+        key = self._key(encrypted_message)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (plaintext, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+    
+    def _remove(self, key):
+        plaintext, _ = self._entries.pop(key)
+        self._bytes -= self._size(plaintext)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+decrypt_cache = DecryptCache(
+    max_entries=Config.DECRYPT_CACHE_MAX_ENTRIES,
+    max_bytes=Config.DECRYPT_CACHE_MAX_BYTES,
+    ttl=Config.DECRYPT_CACHE_TTL,
+    enabled=Config.DECRYPT_CACHE_ENABLED
+)
+
+def _seal(plaintext):
+    """Compress and encrypt UTF-8 bytes into a binary envelope"""
+    token = get_keyring().encrypt(envelope.compress(plaintext))
+    return envelope.pack(base64.urlsafe_b64decode(token), len(plaintext))
+
+def _open(sealed):
+    token, _ = envelope.unpack(sealed)
+    return envelope.decompress(get_keyring().decrypt(base64.urlsafe_b64encode(token)))
 
 def encrypt_message(message):
-    """Encrypt a message"""
+    """
+    Encrypt a message
+    
+    Returns bytes (a compressed binary envelope, stored as BSON binary) unless
+    MESSAGE_ENVELOPE is 'legacy', in which case a base64 Fernet string.
+    """
     try:
         if message is None:
             raise ValueError("Cannot encrypt None value")
@@ -44,23 +210,116 @@ def encrypt_message(message):
         if not isinstance(message, str):
             message = str(message)
             
-        encrypted_message = cipher_suite.encrypt(message.encode('utf-8'))
-        return encrypted_message.decode('utf-8')
+        if Config.MESSAGE_ENVELOPE == 'legacy':
+            encrypted_message = get_keyring().encrypt(message.encode('utf-8')).decode('utf-8')
+        else:
+            encrypted_message = _seal(message.encode('utf-8'))
+        # We already know the plaintext, so the next turn's context read is free
+        decrypt_cache.put(encrypted_message, message)
+        return encrypted_message
     except Exception as e:
         raise RuntimeError(f"Encryption failed: {str(e)}")
 
 def decrypt_message(encrypted_message):
-    """Decrypt a message"""
+    """Decrypt a message stored either as a binary envelope or a legacy Fernet string"""
     try:
         if encrypted_message is None:
             raise ValueError("Cannot decrypt None value")
             
-        if not isinstance(encrypted_message, str):
+        if envelope.is_envelope(encrypted_message):
+            encrypted_message = bytes(encrypted_message)
+        elif not isinstance(encrypted_message, str):
             encrypted_message = str(encrypted_message)
             
-        decrypted_message = cipher_suite.decrypt(encrypted_message.encode('utf-8'))
-        return decrypted_message.decode('utf-8')
+        cached = decrypt_cache.get(encrypted_message)
+        if cached is not None:
+            return cached
+            
+        if isinstance(encrypted_message, bytes):
+            decrypted_message = _open(encrypted_message).decode('utf-8')
+        else:
+            decrypted_message = get_keyring().decrypt(encrypted_message.encode('utf-8')).decode('utf-8')
+        decrypt_cache.put(encrypted_message, decrypted_message)
+        return decrypted_message
     except InvalidToken:
         raise ValueError("Invalid token or corrupted encrypted data")
     except Exception as e:
-        raise RuntimeError(f"Decryption failed: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Decryption failed: {str(e)}")
+
+# Lists shorter than this are processed inline; the pool hand-off costs more than it saves
+PARALLEL_THRESHOLD = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """Return the shared crypto thread pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.CRYPTO_WORKERS, thread_name_prefix='crypto')
+    return _executor
+
+def reset_executor():
+    """Forget the crypto pool; a forked worker inherits its object but not its threads"""
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+def _apply(func, items, return_exceptions):
+    results = []
+    for item in items:
+        try:
+            results.append(func(item))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+def _map(func, items, return_exceptions):
+    items = list(items)
+    workers = Config.CRYPTO_WORKERS
+    if len(items) < PARALLEL_THRESHOLD or workers <= 1:
+        return _apply(func, items, return_exceptions)
+    
+    # The OpenSSL primitives behind Fernet release the GIL, so chunks run in parallel
+    chunk_size = -(-len(items) // workers)
+    executor = _get_executor()
+    futures = [
+        executor.submit(_apply, func, items[i:i + chunk_size], return_exceptions)
+        for i in range(0, len(items), chunk_size)
+    ]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
+
+def encrypt_many(messages, return_exceptions=False):
+    """
+    Encrypt a list of messages in parallel
+    
+    Args:
+        messages (list): Plaintext messages
+        return_exceptions (bool): Put the exception in place of a failed item
+            instead of raising it
+        
+    Returns:
+        list: Encrypted messages in the same order as the input
+    """
+    return _map(encrypt_message, messages, return_exceptions)
+
+def decrypt_many(encrypted_messages, return_exceptions=False):
+    """
+    Decrypt a list of messages in parallel
+    
+    Args:
+        encrypted_messages (list): Encrypted messages
+        return_exceptions (bool): Put the exception in place of a failed item
+            instead of raising it
+        
+    Returns:
+        list: Decrypted messages in the same order as the input
+    """
+    return _map(decrypt_message, encrypted_messages, return_exceptions)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import struct
+import threading
+import zlib
+from config import Config
+
+# Binary storage envelope for encrypted messages (version 1):
+#
+#   byte 0      envelope version (0x01)
+#   bytes 1-4   plaintext length in UTF-8 bytes, big-endian
+#   bytes 5-    raw Fernet token (not base64)
+#
+# Inside the token, the first plaintext byte names the codec used for the rest.
+# The codec is covered by Fernet's HMAC; only the length sits in the clear, and
+# ciphertext size already gave that away. The length lets the prompt builder
+# budget tokens without decrypting, even when the body is compressed.
+#
+# Legacy messages are base64 Fernet strings; anything stored as str is legacy.
+
+VERSION = 1
+HEADER = struct.Struct('>BI')
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+# Below this many bytes compression rarely pays for itself
+COMPRESS_MIN_BYTES = 128
+
+# zstandard contexts must not be used by two threads at once, so each thread gets its own
+_zstd_local = threading.local()
+
+def _zstd():
+    """Return this thread's (compressor, decompressor); zstandard is only needed when zstd is used"""
+    contexts = getattr(_zstd_local, 'contexts', None)
+    if contexts is None:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("MESSAGE_COMPRESSION=zstd requires the zstandard package")
+        contexts = _zstd_local.contexts = (zstandard.ZstdCompressor(level=3), zstandard.ZstdDecompressor())
+    return contexts
+
+def compress(data, codec=None):
+    """Return codec byte + body, falling back to no compression when it doesn't shrink"""
+    codec = CODECS[codec or Config.MESSAGE_COMPRESSION]
+    if codec != CODEC_NONE and len(data) >= COMPRESS_MIN_BYTES:
+        if codec == CODEC_ZLIB:
+            body = zlib.compress(data, 6)
+        else:
+            body = _zstd()[0].compress(data)
+        if len(body) < len(data):
+            return bytes((codec,)) + body
+    return bytes((CODEC_NONE,)) + data
+
+def decompress(payload):
+    codec, body = payload[0], payload[1:]
+    if codec == CODEC_NONE:
+        return body
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    if codec == CODEC_ZSTD:
+        return _zstd()[1].decompress(body)
+    raise ValueError(f"Unknown compression codec {codec}")
+
+def pack(token, plaintext_size):
+    """Wrap a raw Fernet token in a version 1 envelope"""
+    return HEADER.pack(VERSION, plaintext_size) + token
+
+def unpack(envelope):
+    """Return (raw Fernet token, plaintext size) from an envelope"""
+    envelope = bytes(envelope)
+    if len(envelope) < HEADER.size or envelope[0] != VERSION:
+        raise ValueError("Unknown message envelope version")
+    _, plaintext_size = HEADER.unpack_from(envelope)
+    return envelope[HEADER.size:], plaintext_size
+
+def is_envelope(value):
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+def plaintext_size(value):
+    """UTF-8 size of an envelope's plaintext, or None for legacy strings"""
+    if not is_envelope(value) or len(value) < HEADER.size:
+        return None
+    return HEADER.unpack_from(bytes(value[:HEADER.size]))[1]
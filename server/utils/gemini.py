@@ -1,13 +1,315 @@
 import requests
+from requests.adapters import HTTPAdapter
+import asyncio
 import json
 import logging
+import random
 import re
+import threading
+import time
+from contextlib import contextmanager
 from config import Config
+from utils.metrics import timed, record_usage
+from utils.prompt import build_prompt
+from utils.response_cache import response_cache
+from utils.crisis import detector
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+GEMINI_BASE_URL = Config.GEMINI_BASE_URL
+
+# Canned replies used when the upstream call fails or returns something unusable
+UNEXPECTED_FORMAT_RESPONSE = "I notice you're trying to shift our conversation. I'm curious about what brought you here today. Would you like to share what's on your mind?"
+REQUEST_ERROR_RESPONSE = "I'm sensing a slight disconnect in our conversation. Let's take a step back - how are you feeling right now in this moment?"
+JSON_ERROR_RESPONSE = "I'm noticing a pause in our dialogue. Sometimes these moments of reflection can be valuable. What thoughts are coming up for you right now?"
+GENERIC_ERROR_RESPONSE = "I'm wondering if we might need to approach this from a different angle. What aspects of your situation feel most pressing to you right now?"
+
+# Upstream statuses worth retrying: rate limiting and server-side failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling Gemini while the circuit breaker is open"""
+
+class StreamInterruptedError(Exception):
+    """Raised when a streamed reply fails after part of it has already been yielded"""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+    
+    After `threshold` failed calls in a row the circuit opens and calls are
+    rejected for `cooldown` seconds. The first call after the cooldown is let
+    through as a probe; its outcome closes or re-opens the circuit.
+    """
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+    
+    @contextmanager
+    def guard(self):
+        """
+        Admit one call, raising CircuitOpenError while the circuit is open
+        
+        The call should record its outcome; a probe that exits without one
+        (an unexpected exception) is released on the way out, so the circuit
+        can never be left waiting on a probe that is gone.
+        """
+        with self._lock:
+            probe = False
+            if self._opened_at is not None:
+                if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                    raise CircuitOpenError("Gemini circuit breaker is open")
+                self._probing = probe = True
+        try:
+            yield
+        finally:
+            if probe:
+                with self._lock:
+                    self._probing = False
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Gemini circuit opened after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+breaker = CircuitBreaker(Config.GEMINI_BREAKER_THRESHOLD, Config.GEMINI_BREAKER_COOLDOWN)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the process-wide keep-alive session used for Gemini calls"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                if min(Config.GUNICORN_THREADS, Config.GEMINI_MAX_IN_FLIGHT) > Config.GEMINI_POOL_SIZE:
+                    # pool_block has no timeout: calls past the pool size wait until one returns
+                    logger.warning("GEMINI_POOL_SIZE=%d is below the %d Gemini calls that can be in flight; "
+                                   "the extra calls will queue for a connection",
+                                   Config.GEMINI_POOL_SIZE, min(Config.GUNICORN_THREADS, Config.GEMINI_MAX_IN_FLIGHT))
+                # Retries are handled in _post so they can be jittered and fed to the breaker
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.GEMINI_POOL_SIZE, pool_block=True, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+def reset_session():
+    """Drop the session without closing it; for forked workers, whose inherited sockets belong to the parent"""
+    global _session
+    with _session_lock:
+        _session = None
+
+def _backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+    if retry_after:
+        try:
+            return min(float(retry_after), Config.GEMINI_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(Config.GEMINI_BACKOFF_MAX, Config.GEMINI_BACKOFF_BASE * (2 ** attempt)))
+
+def _post(url, payload, stream=False):
+    """
+    POST to Gemini through the pooled session
+    
+    Retries connection errors, timeouts, 429 and 5xx responses with jittered
+    backoff up to GEMINI_MAX_RETRIES times. Exhausted retries count as one
+    circuit breaker failure; while the breaker is open CircuitOpenError is
+    raised without touching the network.
+    """
+    session = get_session()
+    timeout = (Config.GEMINI_CONNECT_TIMEOUT, Config.GEMINI_READ_TIMEOUT)
+    
+    with breaker.guard():
+        for attempt in range(Config.GEMINI_MAX_RETRIES + 1):
+            last_attempt = attempt == Config.GEMINI_MAX_RETRIES
+            try:
+                response = session.post(url, json=payload, timeout=timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt:
+                    breaker.record_failure()
+                    raise
+                logger.warning(f"Gemini request failed ({str(e)}), retrying")
+                time.sleep(_backoff_delay(attempt))
+                continue
+            
+            if response.status_code in RETRYABLE_STATUS:
+                if last_attempt:
+                    breaker.record_failure()
+                    response.raise_for_status()
+                logger.warning(f"Gemini returned {response.status_code}, retrying")
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                time.sleep(_backoff_delay(attempt, retry_after))
+                continue
+            
+            # Other 4xx errors are our fault, but they prove the upstream is up
+            breaker.record_success()
+            response.raise_for_status()
+            return response
+
+_async_client = None
+
+def get_async_client():
+    """Return the shared httpx.AsyncClient used by the ASGI app"""
+    global _async_client
+    if _async_client is None:
+        # Only the async serving mode needs httpx
+        import httpx
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=Config.GEMINI_ASYNC_POOL_SIZE,
+                                max_keepalive_connections=Config.GEMINI_ASYNC_POOL_SIZE),
+            timeout=httpx.Timeout(Config.GEMINI_READ_TIMEOUT, connect=Config.GEMINI_CONNECT_TIMEOUT)
+        )
+    return _async_client
+
+async def close_async_client():
+    """Close the shared async client; call on event loop shutdown"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+async def _post_async(url, payload):
+    """Async counterpart of _post with the same retry and circuit breaker policy"""
+    import httpx
+    
+    client = get_async_client()
+    
+    with breaker.guard():
+        for attempt in range(Config.GEMINI_MAX_RETRIES + 1):
+            last_attempt = attempt == Config.GEMINI_MAX_RETRIES
+            try:
+                response = await client.post(url, json=payload)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    breaker.record_failure()
+                    raise
+                logger.warning(f"Gemini request failed ({str(e)}), retrying")
+                await asyncio.sleep(_backoff_delay(attempt))
+                continue
+            
+            if response.status_code in RETRYABLE_STATUS:
+                if last_attempt:
+                    breaker.record_failure()
+                    response.raise_for_status()
+                logger.warning(f"Gemini returned {response.status_code}, retrying")
+                await asyncio.sleep(_backoff_delay(attempt, response.headers.get('Retry-After')))
+                continue
+            
+            breaker.record_success()
+            response.raise_for_status()
+            return response
+
+def _build_payload(user_message, chat_history=None):
+    """Build the generateContent request body for a user turn"""
+    with timed('prompt_build'):
+        return _generation_payload(build_prompt(user_message, chat_history))
+
+def _generation_payload(prompt, max_output_tokens=800, temperature=0.7):
+    """Wrap prompt text in a generateContent request body"""
+    # Prepare the request payload
+    return {
+        "contents": [
+            {
+                "parts": [
+                    {
+                        "text": prompt
+                    }
+                ]
+            }
+        ],
+        "generationConfig": {
+            "temperature": temperature,
+            "topK": 40,
+            "topP": 0.95,
+            "maxOutputTokens": max_output_tokens,
+        },
+    }
+
+def _extract_text(result):
+    """Return the first candidate's text from a Gemini response, or None"""
+    if 'candidates' in result and len(result['candidates']) > 0:
+        candidate = result['candidates'][0]
+        if 'content' in candidate and 'parts' in candidate['content']:
+            parts = candidate['content']['parts']
+            if len(parts) > 0 and 'text' in parts[0]:
+                return parts[0]['text']
+    return None
+
+def _normalize_whitespace(text):
+    """Collapse literal \\n sequences, newlines and runs of spaces into single spaces"""
+    # 1. Replace literal \n with actual line breaks
+    text = text.replace('\\n', ' ')
+    # 2. Replace multiple newlines with a single one
+    text = re.sub(r'\n+', ' ', text)
+    # 3. Replace multiple spaces with a single space
+    return re.sub(r'\s+', ' ', text)
+
+def clean_response(full_response):
+    """Strip the echoed "Eve:" prefix and normalize whitespace in a model reply"""
+    # Extract just the AI response part (after "Eve:")
+    if "Eve:" in full_response:
+        ai_response = full_response.split("Eve:", 1)[1].strip()
+    else:
+        ai_response = full_response.strip()
+    
+    return _normalize_whitespace(ai_response)
+
+def _parse_result(result):
+    """Turn a generateContent response body into Eve's cleaned reply"""
+    record_usage(result)
+    # Serializing the whole body is only worth it when someone is reading debug logs
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Received response from Gemini API: %s...", json.dumps(result)[:200])
+    
+    # Extract the response text
+    full_response = _extract_text(result)
+    if full_response is not None:
+        return clean_response(full_response)
+    
+    logger.error(f"Unexpected response format: {json.dumps(result)}")
+    return UNEXPECTED_FORMAT_RESPONSE
+
+def _cacheable(user_message, chat_history):
+    # Only history-free prompts are shared between users, and a crisis message
+    # must always reach the crisis screen's response, never a cached reply
+    return not chat_history and not detector.is_crisis(user_message)
+
+def _cached_response(user_message, chat_history, payload):
+    """Return the cached reply for this prompt, or None"""
+    if not _cacheable(user_message, chat_history):
+        return None
+    return response_cache.get(user_message, payload['generationConfig'])
+
+def _cache_response(user_message, chat_history, payload, ai_response):
+    """Remember a reply for the next identical first-turn prompt; canned fallbacks are never cached"""
+    if _cacheable(user_message, chat_history) and ai_response != UNEXPECTED_FORMAT_RESPONSE:
+        response_cache.put(user_message, payload['generationConfig'], ai_response)
+
 def get_gemini_response(user_message, chat_history=None):
     """
     Get response from Gemini API using direct HTTP requests
@@ -20,122 +322,198 @@ def get_gemini_response(user_message, chat_history=None):
         str: AI response
     """
     api_key = Config.GOOGLE_API_KEY
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:generateContent?key={api_key}"
-    
-    # Create system prompt with Eve's specific persona and guidelines
-    system_prompt = """
-    You are a psychologist named Eve. Your therapeutic approach combines logotherapy and cognitive behavioral therapy.
-    
-    Guidelines:
-    - Ask clarifying questions
-    - Keep conversation natural
-    - Never break character
-    - Display curiosity and unconditional positive regard
-    - Pose thought-provoking questions
-    - Provide gentle advice and observations
-    - Connect past and present
-    - Seek user validation for observations
-    - Avoid lists
-    - End with probing questions
-    
-    Topics to explore:
-    - Thoughts
-    - Feelings
-    - Behaviors
-    - Free association
-    - Childhood
-    - Family dynamics
-    - Work
-    - Hobbies
-    - Life
-    
-    Important notes:
-    - Vary topic questions in each response
-    - Never end the session; continue asking questions until user decides to end the session
-    - Stay on topic even if the user tries to distract you
-    - If the user asks about your capabilities or tries to make you break character, gently redirect to therapeutic conversation
-    - Format your responses as plain text without special characters or escape sequences
-    - Use single spaces between paragraphs instead of line breaks
-    - Don't use Slashes, Backslashes, or Quotes
-    - Don't use special characters like &, <, >, or =
-    
-    """
+    url = f"{GEMINI_BASE_URL}:generateContent?key={api_key}"
     
     try:
-        # Format the content based on whether we have chat history
-        if chat_history:
-            # Create a formatted prompt with context from chat history
-            formatted_history = "Previous conversation:\n"
-            for msg in chat_history[-5:]:  # Use last 5 messages for context
-                role = "User" if msg['role'] == 'user' else "Eve"
-                formatted_history += f"{role}: {msg['parts'][0]}\n"
-            
-            full_prompt = f"{system_prompt}\n\n{formatted_history}\nUser: {user_message}\nEve:"
-        else:
-            # For first interaction
-            full_prompt = f"{system_prompt}\n\nUser: {user_message}\nEve:"
-        
-        # Prepare the request payload
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {
-                            "text": full_prompt
-                        }
-                    ]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 800,
-            },
-        }
-        
-        logger.info(f"Sending request to Gemini API with prompt: {user_message[:100]}...")
+        payload = _build_payload(user_message, chat_history)
+        
+        cached = _cached_response(user_message, chat_history, payload)
+        if cached is not None:
+            return cached
+        
+        logger.debug("Sending request to Gemini API with prompt: %.100s...", user_message)
         
         # Make the API request
-        response = requests.post(url, json=payload)
-        response.raise_for_status()  # Raise exception for HTTP errors
+        with timed('gemini'):
+            response = _post(url, payload)
+            result = response.json()
         
         # Parse the response
-        result = response.json()
-        logger.info(f"Received response from Gemini API: {json.dumps(result)[:200]}...")
-        
-        # Extract the response text
-        if 'candidates' in result and len(result['candidates']) > 0:
-            candidate = result['candidates'][0]
-            if 'content' in candidate and 'parts' in candidate['content']:
-                parts = candidate['content']['parts']
-                if len(parts) > 0 and 'text' in parts[0]:
-                    # Extract just the AI response part (after "Eve:")
-                    full_response = parts[0]['text']
-                    if "Eve:" in full_response:
-                        ai_response = full_response.split("Eve:", 1)[1].strip()
-                    else:
-                        ai_response = full_response.strip()
-                    
-                    # Clean up the response:
-                    # 1. Replace literal \n with actual line breaks
-                    ai_response = ai_response.replace('\\n', ' ')
-                    # 2. Replace multiple newlines with a single one
-                    ai_response = re.sub(r'\n+', ' ', ai_response)
-                    # 3. Replace multiple spaces with a single space
-                    ai_response = re.sub(r'\s+', ' ', ai_response)
-                    
-                    return ai_response
-        
-        logger.error(f"Unexpected response format: {json.dumps(result)}")
-        return "I notice you're trying to shift our conversation. I'm curious about what brought you here today. Would you like to share what's on your mind?"
+        ai_response = _parse_result(result)
+        _cache_response(user_message, chat_history, payload, ai_response)
+        return ai_response
+        
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Request error: {str(e)}")
+        return REQUEST_ERROR_RESPONSE
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error: {str(e)}")
+        return JSON_ERROR_RESPONSE
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return GENERIC_ERROR_RESPONSE
+
+def generate_text(prompt, max_output_tokens=800, temperature=0.7):
+    """
+    Run a raw prompt through Gemini for internal jobs such as summarization
+    
+    Unlike get_gemini_response there is no persona and no canned fallback:
+    failures return None so callers never store a placeholder.
+    
+    Returns:
+        str or None: The model's text, stripped
+    """
+    api_key = Config.GOOGLE_API_KEY
+    url = f"{GEMINI_BASE_URL}:generateContent?key={api_key}"
+    
+    try:
+        with timed('gemini'):
+            response = _post(url, _generation_payload(prompt, max_output_tokens, temperature))
+            result = response.json()
+        record_usage(result)
+        text = _extract_text(result)
+        return text.strip() if text else None
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        logger.error(f"Gemini text generation failed: {str(e)}")
+        return None
+
+def stream_gemini_response(user_message, chat_history=None):
+    """
+    Stream a response from the Gemini API as it is generated
+    
+    Uses streamGenerateContent with server-sent events so the first words
+    reach the client long before the full reply is finished.
+    
+    Args:
+        user_message (str): The user's message
+        chat_history (list, optional): List of previous messages
+        
+    Yields:
+        str: Cleaned text chunks; joined they form the full AI response
+    
+    Raises:
+        StreamInterruptedError: The upstream failed after some text was yielded,
+            so the chunks so far are not a complete reply
+    """
+    api_key = Config.GOOGLE_API_KEY
+    url = f"{GEMINI_BASE_URL}:streamGenerateContent?alt=sse&key={api_key}"
+    
+    # Text is held back until we know whether the model echoed the "Eve:" prefix
+    pending = ""
+    prefix_checked = False
+    emitted = False
+    parts = []
+    
+    try:
+        payload = _build_payload(user_message, chat_history)
+        
+        cached = _cached_response(user_message, chat_history, payload)
+        if cached is not None:
+            yield cached
+            return
+        
+        logger.debug("Streaming request to Gemini API with prompt: %.100s...", user_message)
+        
+        # Times the whole stream, including the client's pace of consuming it
+        usage = None
+        with timed('gemini'), _post(url, payload, stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                # SSE frames look like "data: {...}"; skip keep-alives and blank separators
+                if not line or not line.startswith('data:'):
+                    continue
+                
+                event = json.loads(line[len('data:'):].strip())
+                # Every event carries the running totals; only the last one counts
+                usage = event.get('usageMetadata') or usage
+                text = _extract_text(event)
+                if not text:
+                    continue
+                
+                if not prefix_checked:
+                    pending += text
+                    stripped = pending.lstrip()
+                    if len(stripped) < len("Eve:") and "Eve:".startswith(stripped):
+                        continue
+                    if stripped.startswith("Eve:"):
+                        stripped = stripped[len("Eve:"):].lstrip()
+                    prefix_checked = True
+                    text = stripped
+                    if not text:
+                        continue
+                
+                chunk = _normalize_whitespace(text)
+                if chunk:
+                    emitted = True
+                    parts.append(chunk)
+                    yield chunk
+        
+        record_usage({'usageMetadata': usage})
+        
+        # The whole reply was shorter than the prefix we were waiting on
+        if not prefix_checked and pending.strip():
+            emitted = True
+            parts.append(clean_response(pending))
+            yield parts[-1]
+        
+        if not emitted:
+            logger.error("Gemini stream finished without any text")
+            yield UNEXPECTED_FORMAT_RESPONSE
+        else:
+            _cache_response(user_message, chat_history, payload, ''.join(parts).strip())
         
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error: {str(e)}")
-        return "I'm sensing a slight disconnect in our conversation. Let's take a step back - how are you feeling right now in this moment?"
+        if emitted:
+            raise StreamInterruptedError(str(e)) from e
+        yield REQUEST_ERROR_RESPONSE
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error: {str(e)}")
+        if emitted:
+            raise StreamInterruptedError(str(e)) from e
+        yield JSON_ERROR_RESPONSE
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        if emitted:
+            raise StreamInterruptedError(str(e)) from e
+        yield GENERIC_ERROR_RESPONSE
+
+async def get_gemini_response_async(user_message, chat_history=None):
+    """
+    Get response from Gemini API without blocking the event loop
+    
+    Args:
+        user_message (str): The user's message
+        chat_history (list, optional): List of previous messages
+        
+    Returns:
+        str: AI response
+    """
+    import httpx
+    
+    api_key = Config.GOOGLE_API_KEY
+    url = f"{GEMINI_BASE_URL}:generateContent?key={api_key}"
+    
+    try:
+        payload = _build_payload(user_message, chat_history)
+        
+        cached = _cached_response(user_message, chat_history, payload)
+        if cached is not None:
+            return cached
+        
+        logger.debug("Sending async request to Gemini API with prompt: %.100s...", user_message)
+        
+        with timed('gemini'):
+            response = await _post_async(url, payload)
+        ai_response = _parse_result(response.json())
+        _cache_response(user_message, chat_history, payload, ai_response)
+        return ai_response
+        
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        logger.error(f"Request error: {str(e)}")
+        return REQUEST_ERROR_RESPONSE
     except json.JSONDecodeError as e:
         logger.error(f"JSON decode error: {str(e)}")
-        return "I'm noticing a pause in our dialogue. Sometimes these moments of reflection can be valuable. What thoughts are coming up for you right now?"
+        return JSON_ERROR_RESPONSE
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
-        return "I'm wondering if we might need to approach this from a different angle. What aspects of your situation feel most pressing to you right now?"
\ No newline at end of file
+        return GENERIC_ERROR_RESPONSE
\ No newline at end of file
@@ -0,0 +1,188 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus text-format metrics, kept in-process
+#
+# Metrics are per process: under a multi-worker server each worker exposes its
+# own /metrics and the scraper aggregates them.
+
+# Seconds; wide enough to cover both a cache hit and a slow Gemini call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))]),
+                       cumulative)
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), cumulative
+
+class CacheStats:
+    """
+    Exposes hit/miss counts of the process caches, read at scrape time
+
+    Caches are registered as objects with `hits` and `misses` attributes (and
+    optionally `near_hits`, counted as hits), so the caches themselves carry
+    no metrics code.
+    """
+    def __init__(self):
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, cache):
+        with self._lock:
+            self._caches[name] = cache
+
+    def metrics(self):
+        with self._lock:
+            caches = sorted(self._caches.items())
+        hits, misses, ratios = [], [], []
+        for name, cache in caches:
+            hit_count = cache.hits + getattr(cache, 'near_hits', 0)
+            lookups = hit_count + cache.misses
+            labels = _format_labels(('cache',), (name,))
+            hits.append(('eve_cache_hits_total', labels, hit_count))
+            misses.append(('eve_cache_misses_total', labels, cache.misses))
+            ratios.append(('eve_cache_hit_ratio', labels, hit_count / lookups if lookups else 0.0))
+        return [
+            ('eve_cache_hits_total', 'counter', 'Cache lookups answered from the cache', hits),
+            ('eve_cache_misses_total', 'counter', 'Cache lookups that fell through', misses),
+            ('eve_cache_hit_ratio', 'gauge', 'Share of cache lookups answered from the cache', ratios),
+        ]
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self.caches = CacheStats()
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        families = [(m.name, m.type, m.documentation, list(m.samples())) for m in self._metrics]
+        families += self.caches.metrics()
+        lines = []
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+request_seconds = registry.register(Histogram(
+    'eve_http_request_duration_seconds', 'Time to handle an HTTP request',
+    ('route', 'method', 'status')
+))
+stage_seconds = registry.register(Histogram(
+    'eve_stage_duration_seconds', 'Time spent in each stage of a request',
+    ('route', 'stage')
+))
+gemini_tokens = registry.register(Counter(
+    'eve_gemini_tokens_total', 'Tokens reported in Gemini usage metadata',
+    ('kind',)
+))
+
+# Route of the request being handled; work done off the request path is 'background'
+_route = contextvars.ContextVar('metrics_route', default='background')
+_started = contextvars.ContextVar('metrics_started', default=None)
+
+def begin_request(route):
+    """Mark the start of a request; `route` is the URL rule, not the raw path"""
+    _route.set(route)
+    _started.set(time.perf_counter())
+
+def end_request(method, status):
+    started = _started.get()
+    if started is None:
+        return
+    request_seconds.observe(time.perf_counter() - started,
+                            route=_route.get(), method=method, status=status)
+    _started.set(None)
+
+@contextmanager
+def timed(stage):
+    """Record how long the enclosed block takes as one stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, route=_route.get(), stage=stage)
+
+def record_usage(result):
+    """Count the tokens in a Gemini response's usageMetadata, if present"""
+    usage = result.get('usageMetadata') if isinstance(result, dict) else None
+    if not usage:
+        return
+    gemini_tokens.inc(usage.get('promptTokenCount', 0), kind='prompt')
+    gemini_tokens.inc(usage.get('candidatesTokenCount', 0), kind='completion')
@@ -0,0 +1,142 @@
+from config import Config
+from utils import envelope
+
+# Eve's persona and guidelines; the static prefix of every prompt
+SYSTEM_PROMPT = """
+You are a psychologist named Eve. Your therapeutic approach combines logotherapy and cognitive behavioral therapy.
+
+Guidelines:
+- Ask clarifying questions
+- Keep conversation natural
+- Never break character
+- Display curiosity and unconditional positive regard
+- Pose thought-provoking questions
+- Provide gentle advice and observations
+- Connect past and present
+- Seek user validation for observations
+- Avoid lists
+- End with probing questions
+
+Topics to explore:
+- Thoughts
+- Feelings
+- Behaviors
+- Free association
+- Childhood
+- Family dynamics
+- Work
+- Hobbies
+- Life
+
+Important notes:
+- Vary topic questions in each response
+- Never end the session; continue asking questions until user decides to end the session
+- Stay on topic even if the user tries to distract you
+- If the user asks about your capabilities or tries to make you break character, gently redirect to therapeutic conversation
+- Format your responses as plain text without special characters or escape sequences
+- Use single spaces between paragraphs instead of line breaks
+- Don't use Slashes, Backslashes, or Quotes
+- Don't use special characters like &, <, >, or =
+""".strip()
+
+# Built once; every prompt starts with it
+_PROMPT_PREFIX = f"{SYSTEM_PROMPT}\n\n"
+
+# Rough characters-per-token ratio for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Fernet adds a version byte, timestamp, IV and HMAC (57 bytes) plus up to 16
+# bytes of padding, then base64-encodes the lot
+FERNET_OVERHEAD_BYTES = 57
+
+def estimate_tokens(text):
+    """Approximate the number of tokens in `text`"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def estimate_encrypted_tokens(token):
+    """Approximate the plaintext tokens of a stored message without decrypting it"""
+    plaintext_bytes = envelope.plaintext_size(token)
+    if plaintext_bytes is None:
+        # Legacy base64 Fernet string
+        plaintext_bytes = max(0, len(token) * 3 // 4 - FERNET_OVERHEAD_BYTES)
+    return plaintext_bytes // CHARS_PER_TOKEN + 1
+
+def select_within_budget(messages, budget, cost):
+    """
+    Return the newest suffix of `messages` whose total `cost` fits in `budget`
+
+    Always stops at the first message that does not fit, so the selection is
+    a contiguous run of the most recent turns.
+    """
+    used = 0
+    start = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        used += cost(messages[i])
+        if used > budget:
+            break
+        start = i
+    return messages[start:]
+
+def whole_turns(messages, reply_role):
+    """
+    Drop leading replies whose user message is not in `messages`
+
+    Both sides of a turn share a timestamp, so a cut between them would leave
+    the summarizer unable to tell which side it had already folded in; a
+    selection that starts on a turn boundary never has that problem.
+    """
+    start = 0
+    while start < len(messages) and messages[start]['role'] == reply_role:
+        start += 1
+    return messages[start:]
+
+def select_stored_history(messages, budget=None):
+    """Pick the most recent whole turns of stored (encrypted) messages that fit in the history token budget"""
+    if budget is None:
+        budget = Config.PROMPT_HISTORY_TOKEN_BUDGET
+    selected = select_within_budget(messages, budget, lambda msg: estimate_encrypted_tokens(msg['content']))
+    return whole_turns(selected, 'assistant')
+
+def select_history(chat_history, budget=None):
+    """Pick the most recent whole Gemini-format turns that fit in the history token budget"""
+    if budget is None:
+        budget = Config.PROMPT_HISTORY_TOKEN_BUDGET
+    selected = select_within_budget(chat_history, budget, lambda msg: estimate_tokens(msg['parts'][0]))
+    return whole_turns(selected, 'model')
+
+def build_prompt(user_message, chat_history=None):
+    """
+    Assemble the full prompt for a user turn
+
+    Args:
+        user_message (str): The user's message
+        chat_history (list, optional): Previous turns in Gemini format, oldest
+            first; a leading {"role": "summary"} entry carries the running
+            summary of older messages
+
+    Returns:
+        str: The prompt text
+    """
+    chat_history = chat_history or []
+    summary = [msg['parts'][0] for msg in chat_history if msg['role'] == 'summary']
+    history = select_history([msg for msg in chat_history if msg['role'] != 'summary'])
+    if not summary and not history:
+        # For first interaction
+        return f"{_PROMPT_PREFIX}User: {user_message}\nEve:"
+
+    lines = []
+    if summary:
+        lines.append("Summary of earlier conversation:")
+        lines.append(summary[0])
+        lines.append("")
+
+    # Create a formatted prompt with context from chat history
+    if history:
+        lines.append("Previous conversation:")
+        for msg in history:
+            role = "User" if msg['role'] == 'user' else "Eve"
+            lines.append(f"{role}: {msg['parts'][0]}")
+        lines.append("")
+    lines.append(f"User: {user_message}")
+    lines.append("Eve:")
+    return _PROMPT_PREFIX + "\n".join(lines)
@@ -0,0 +1,112 @@
+import asyncio
+import math
+import threading
+import time
+from config import Config
+
+class RateLimitExceeded(Exception):
+    """Raised when a request must be turned away; routes answer 429 with Retry-After"""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class InMemoryRateLimitStore:
+    """
+    Process-local token buckets keyed by an arbitrary string
+
+    A shared store (e.g. Redis running the same refill arithmetic in a Lua
+    script) only needs to provide `take` with the same signature.
+    """
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, cost=1):
+        """Spend `cost` tokens; return 0 if allowed, else seconds until it would be"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (cost - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, rate, capacity)
+            return retry_after
+
+    def _prune(self, now, rate, capacity):
+        # Buckets idle long enough to have refilled completely carry no state
+        idle = capacity / rate
+        for key in [k for k, (_, last) in self._buckets.items() if now - last >= idle]:
+            del self._buckets[key]
+
+class UserRateLimiter:
+    """Per-user token bucket: `per_minute` sustained requests with bursts up to `burst`"""
+    def __init__(self, store, per_minute, burst, enabled=True):
+        self.store = store
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.enabled = enabled
+
+    def check(self, user_id):
+        if not self.enabled:
+            return
+        retry_after = self.store.take(f"user:{user_id}", self.rate, self.burst)
+        if retry_after > 0:
+            raise RateLimitExceeded('Too many messages, please slow down!', retry_after)
+
+class AdmissionController:
+    """
+    Caps the number of Gemini calls in flight in this process
+
+    Callers wait up to `timeout` seconds for a slot (0 fails fast) and get
+    RateLimitExceeded when none frees up, instead of piling more load onto
+    an upstream that is already saturated.
+    """
+    def __init__(self, max_in_flight, timeout):
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RateLimitExceeded('Eve is helping a lot of people right now, please try again shortly.',
+                                    max(1.0, self.timeout))
+
+    async def acquire_async(self):
+        # A thread semaphore polled without blocking, so the event loop never waits on it
+        deadline = time.monotonic() + self.timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise RateLimitExceeded('Eve is helping a lot of people right now, please try again shortly.',
+                                        max(1.0, self.timeout))
+            await asyncio.sleep(0.05)
+
+    def release(self):
+        self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def retry_after_header(retry_after):
+    """Retry-After takes whole seconds"""
+    return str(max(1, math.ceil(retry_after)))
+
+user_limiter = UserRateLimiter(
+    InMemoryRateLimitStore(),
+    per_minute=Config.RATE_LIMIT_PER_MINUTE,
+    burst=Config.RATE_LIMIT_BURST,
+    enabled=Config.RATE_LIMIT_ENABLED
+)
+
+# Blocking calls from the Flask routes, and calls from the async routes; each is sized to its client's pool
+gemini_admission = AdmissionController(Config.GEMINI_MAX_IN_FLIGHT, Config.GEMINI_ADMISSION_TIMEOUT)
+gemini_async_admission = AdmissionController(Config.GEMINI_ASYNC_MAX_IN_FLIGHT, Config.GEMINI_ADMISSION_TIMEOUT)
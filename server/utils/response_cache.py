@@ -0,0 +1,131 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+def normalize_prompt(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', text.lower())).strip()
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def config_key(generation_config):
+    """Stable key for a generationConfig dict"""
+    return json.dumps(generation_config, sort_keys=True)
+
+class ResponseCache:
+    """
+    LRU/TTL cache of model replies for prompts that carry no conversation history
+
+    Lookups match the normalized user message exactly, or, when `similarity`
+    is above zero, the closest cached message whose character-trigram Jaccard
+    similarity reaches it. Candidates come from an inverted trigram index, so
+    a lookup only scores entries that share n-grams with the message.
+    Only history-free (first turn) prompts may be cached: they contain nothing
+    but the persona and the message itself, so no user's history can leak
+    into another user's reply.
+    """
+    def __init__(self, max_entries, ttl, similarity, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.enabled = enabled
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_message, generation_config):
+        if not self.enabled:
+            return None
+        normalized = normalize_prompt(user_message)
+        config = config_key(generation_config)
+        now = time.monotonic()
+        with self._lock:
+            key = (config, normalized)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if self.similarity > 0:
+                key = self._nearest(config, normalized, now)
+                if key is not None:
+                    self._entries.move_to_end(key)
+                    self.near_hits += 1
+                    return self._entries[key][1]
+
+            self.misses += 1
+            return None
+
+    def _nearest(self, config, normalized, now):
+        grams = _trigrams(normalized)
+        candidates = set()
+        for gram in grams:
+            candidates.update(self._index.get((config, gram), ()))
+
+        best, best_score = None, self.similarity
+        for key in candidates:
+            entry_grams, _, expires_at = self._entries[key]
+            if expires_at <= now:
+                continue
+            score = len(grams & entry_grams) / len(grams | entry_grams)
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def put(self, user_message, generation_config, response):
+        if not self.enabled:
+            return
+        normalized = normalize_prompt(user_message)
+        config = config_key(generation_config)
+        key = (config, normalized)
+        grams = _trigrams(normalized)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (grams, response, time.monotonic() + self.ttl)
+            for gram in grams:
+                self._index.setdefault((config, gram), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        grams, _, _ = self._entries.pop(key)
+        for gram in grams:
+            keys = self._index.get((key[0], gram))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(key[0], gram)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.near_hits) / lookups if lookups else 0.0
+            }
+
+response_cache = ResponseCache(
+    max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=Config.RESPONSE_CACHE_TTL,
+    similarity=Config.RESPONSE_CACHE_SIMILARITY,
+    enabled=Config.RESPONSE_CACHE_ENABLED
+)
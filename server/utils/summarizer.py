@@ -0,0 +1,187 @@
+import logging
+import queue
+import threading
+from datetime import datetime
+from bson import ObjectId
+from config import Config
+from utils.chat_store import get_recent_messages
+from utils.context_cache import create_context_cache
+from utils.metrics import timed
+from utils.encryption import encrypt_message, decrypt_message, decrypt_many
+from utils.prompt import select_stored_history
+from utils.gemini import generate_text
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """You maintain private clinical notes for Eve, a psychologist, about an ongoing conversation with a client.
+Update the running summary with the new exchanges below. Keep what matters for continuing therapy:
+recurring themes, feelings, people and events the client mentioned, goals, and anything Eve promised to revisit.
+Write plain prose in the third person, at most {max_words} words, with no lists or headings.
+
+Current summary:
+{summary}
+
+New exchanges:
+{exchanges}
+
+Updated summary:"""
+
+# Just enough of a chats document to tell whether a cached summary is current
+SUMMARY_PROBE = {'_id': 0, 'summary_through': 1}
+SUMMARY_FIELDS = {'summary': 1, 'summary_through': 1}
+
+class ConversationSummarizer:
+    """
+    Keeps an encrypted running summary of each user's older messages
+
+    Each chat turn calls `note_turn`, which only bumps an in-process counter.
+    Every SUMMARY_EVERY_TURNS turns the user is queued for a background
+    thread that folds the messages that have scrolled out of the verbatim
+    context into the summary stored on the user's `chats` document. The
+    verbatim context is what prompts actually include: the newest whole turns
+    of the window that fit in PROMPT_HISTORY_TOKEN_BUDGET, so long replies
+    move more messages into the summary. The request path never waits on
+    the summarization call.
+    """
+    def __init__(self, chats_collection, messages_collection, window_messages):
+        self.chats_collection = chats_collection
+        self.messages_collection = messages_collection
+        # Most messages prompts include verbatim; the token budget usually binds first
+        self.window_messages = window_messages
+        self.every_turns = Config.SUMMARY_EVERY_TURNS
+        self.enabled = Config.SUMMARY_ENABLED
+        # Decrypted summaries, so prompts don't need a MongoDB read per turn
+        self.cache = create_context_cache(1, namespace='summary')
+        self._turns = {}
+        self._queued = set()
+        self._queue = queue.Queue(maxsize=Config.SUMMARY_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def summary_turns(self, user_id):
+        """Return the user's summary as a Gemini-format turn list ([] when there is none)"""
+        if not self.enabled:
+            return []
+        with timed('mongo_read'):
+            probe = self.chats_collection.find_one({'user_id': ObjectId(user_id)}, SUMMARY_PROBE)
+        turns = self.cached_turns(user_id, probe)
+        if turns is None:
+            with timed('mongo_read'):
+                chat = self.chats_collection.find_one({'user_id': ObjectId(user_id)}, SUMMARY_FIELDS)
+            turns = self.remember(user_id, chat)
+        return turns
+
+    def cached_turns(self, user_id, probe):
+        """
+        Return the cached summary turns if they are as new as the stored summary
+
+        `probe` is the user's chats document projected to SUMMARY_PROBE. Another
+        worker may have refreshed the summary since this one cached it, and the
+        messages it folded in have already left the verbatim context. Returns []
+        when the user has no summary and None when the cache must be refilled.
+        """
+        through = (probe or {}).get('summary_through')
+        if through is None:
+            return []
+        return self.cache.get(user_id, through)
+
+    def remember(self, user_id, chat):
+        """Cache the summary from a chats document projected to SUMMARY_FIELDS and return its turns"""
+        turns = self.turns_from_document(chat)
+        self.cache.set(user_id, turns, (chat or {}).get('summary_through'))
+        return turns
+
+    @staticmethod
+    def turns_from_document(chat):
+        if not chat or not chat.get('summary'):
+            return []
+        return [{"role": "summary", "parts": [decrypt_message(chat['summary'])]}]
+
+    def note_turn(self, user_id):
+        """Count a persisted turn and queue a refresh every SUMMARY_EVERY_TURNS turns"""
+        if not self.enabled:
+            return
+        with self._lock:
+            turns = self._turns.get(user_id, 0) + 1
+            if turns < self.every_turns or user_id in self._queued:
+                self._turns[user_id] = turns
+                return
+            self._turns.pop(user_id, None)
+            self._queued.add(user_id)
+        try:
+            self._queue.put_nowait(user_id)
+        except queue.Full:
+            # Dropping is safe: the next batch of turns queues the user again
+            with self._lock:
+                self._queued.discard(user_id)
+            logger.warning("Summary queue full; skipping refresh")
+            return
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='summarizer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            try:
+                self.refresh(user_id)
+            except Exception as e:
+                logger.error(f"Summary refresh failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._queued.discard(user_id)
+                self._queue.task_done()
+
+    def refresh(self, user_id):
+        """Fold messages that left the context window into the stored summary"""
+        object_id = ObjectId(user_id)
+        chat = self.chats_collection.find_one(
+            {'user_id': object_id},
+            {'summary': 1, 'summary_through': 1}
+        ) or {}
+        summarized_through = chat.get('summary_through')
+
+        # Bounded read: the window plus at most two refresh intervals of older turns
+        recent = get_recent_messages(self.messages_collection, object_id,
+                                     self.window_messages + 4 * self.every_turns)
+        older = recent[:len(recent) - len(self.verbatim(recent))]
+        pending = [m for m in older if summarized_through is None or m['timestamp'] > summarized_through]
+        if not pending:
+            return False
+
+        previous = decrypt_message(chat['summary']) if chat.get('summary') else "(none yet)"
+        contents = decrypt_many([m['content'] for m in pending])
+        exchanges = "\n".join(
+            f"{'Client' if m['role'] == 'user' else 'Eve'}: {content}"
+            for m, content in zip(pending, contents)
+        )
+        prompt = SUMMARY_PROMPT.format(
+            max_words=Config.SUMMARY_MAX_WORDS,
+            summary=previous,
+            exchanges=exchanges
+        )
+
+        summary = generate_text(prompt, max_output_tokens=Config.SUMMARY_MAX_WORDS * 2, temperature=0.2)
+        if not summary:
+            return False
+
+        self.chats_collection.update_one(
+            {'user_id': object_id},
+            {'$set': {
+                'summary': encrypt_message(summary),
+                'summary_through': pending[-1]['timestamp'],
+                'summary_updated_at': datetime.utcnow()
+            }},
+            upsert=True
+        )
+        self.cache.set(user_id, [{"role": "summary", "parts": [summary]}], pending[-1]['timestamp'])
+        return True
+
+    def verbatim(self, recent):
+        """The newest stored messages a prompt includes as-is, chosen exactly as decrypt_turns does"""
+        window = recent[-self.window_messages:] if self.window_messages else []
+        return select_stored_history(window)
@@ -0,0 +1,170 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from config import Config
+from utils.metrics import timed
+from utils.chat_store import BUCKET_SIZE, build_append_update, build_close_update, append_messages
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindQueue:
+    """
+    Persists chat messages to the bucket collection off the request path
+
+    In 'sync' mode `submit` writes immediately, exactly like append_messages.
+    In 'async' mode it only enqueues; a background thread drains the queue in
+    batches and writes each batch with one ordered bulk_write, one upsert per
+    user (split at bucket boundaries). Transient MongoDB errors are retried
+    with backoff. Each upsert also records a write id on its bucket, so after
+    a dropped connection the upserts that did land are found and skipped
+    rather than pushing their messages twice. The queue is bounded: when it
+    is full, `submit` falls back to a synchronous write instead of growing
+    memory or dropping messages. Pending messages are flushed on interpreter
+    exit.
+    """
+    def __init__(self, collection, mode=None):
+        self.collection = collection
+        self.mode = mode or Config.PERSISTENCE_MODE
+        self.batch_size = Config.WRITE_BEHIND_BATCH_SIZE
+        self.flush_interval = Config.WRITE_BEHIND_FLUSH_INTERVAL
+        self.max_retries = Config.WRITE_BEHIND_MAX_RETRIES
+        self._queue = queue.Queue(maxsize=Config.WRITE_BEHIND_MAX_PENDING)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        if self.mode == 'async':
+            atexit.register(self.close)
+
+    @property
+    def is_async(self):
+        return self.mode == 'async' and not self._closed
+
+    def submit(self, user_id, messages):
+        """Persist messages for a user, now or from the background thread"""
+        if not self.is_async:
+            append_messages(self.collection, user_id, messages)
+            return
+        try:
+            self._queue.put_nowait((user_id, messages))
+        except queue.Full:
+            logger.warning("Write-behind queue full; writing synchronously")
+            append_messages(self.collection, user_id, messages)
+            return
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Give concurrent requests a moment to join the batch
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Write-behind batch of {len(batch)} turns failed: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _chunks(batch):
+        """(user_id, messages, write id) per user and bucket-sized chunk, preserving submit order"""
+        grouped = {}
+        for user_id, messages in batch:
+            grouped.setdefault(user_id, []).extend(messages)
+
+        chunks = []
+        for user_id, messages in grouped.items():
+            for i in range(0, len(messages), BUCKET_SIZE):
+                chunks.append((user_id, messages[i:i + BUCKET_SIZE], ObjectId()))
+        return chunks
+
+    @staticmethod
+    def _operation(user_id, messages, write_id):
+        query, update = build_append_update(user_id, messages)
+        update['$push']['write_ids'] = write_id
+        return UpdateOne(query, update, upsert=True)
+
+    def _applied(self, chunks):
+        """Write ids among `chunks` that already reached MongoDB"""
+        ids = [write_id for _, _, write_id in chunks]
+        buckets = self.collection.find(
+            {'user_id': {'$in': list({user_id for user_id, _, _ in chunks})}, 'write_ids': {'$in': ids}},
+            {'write_ids': 1}
+        )
+        return {write_id for bucket in buckets for write_id in bucket['write_ids']}
+
+    def _write(self, batch):
+        chunks = self._chunks(batch)
+        attempt = 0
+        rolled_over = None
+        full_bucket = None
+        interrupted = False
+        while chunks:
+            try:
+                if interrupted:
+                    # Part of the batch may have landed before the connection dropped
+                    applied = self._applied(chunks)
+                    chunks = [chunk for chunk in chunks if chunk[2] not in applied]
+                    interrupted = False
+                    if not chunks:
+                        return
+                if full_bucket is not None:
+                    # Close the user's full open bucket so the upsert opens the next one
+                    self.collection.update_one(*build_close_update(*full_bucket[:2]))
+                    full_bucket = None
+                with timed('mongo_write'):
+                    self.collection.bulk_write([self._operation(*chunk) for chunk in chunks], ordered=True)
+                return
+            except BulkWriteError as e:
+                # Ordered: everything before the first error was applied
+                error = e.details['writeErrors'][0]
+                index = error['index']
+                if error.get('code') == 11000 and chunks[index] is not rolled_over:
+                    # Collided with the user's open bucket: it is full
+                    rolled_over = full_bucket = chunks[index]
+                    chunks = chunks[index:]
+                    continue
+                # Skip the bad op
+                logger.error(f"Dropping chat write that failed: {error.get('errmsg')}")
+                chunks = chunks[index + 1:]
+            except ConnectionFailure as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Giving up on {len(chunks)} chat writes after {attempt} attempts: {str(e)}")
+                    return
+                delay = random.uniform(0, min(5.0, 0.1 * (2 ** attempt)))
+                logger.warning(f"Transient MongoDB error ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                interrupted = True
+
+    def flush(self):
+        """Block until every submitted message has been written (or given up on)"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Flush pending writes and switch to synchronous writes"""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
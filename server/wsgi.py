@@ -0,0 +1,12 @@
+"""
+Production WSGI entry point
+
+Run with:
+    gunicorn -c gunicorn.conf.py
+
+gunicorn.conf.py preloads this module in the master process and resets the
+per-process clients in each forked worker.
+"""
+from app import create_app
+
+app = create_app()